@@ -0,0 +1,40 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+"""
+Micro-benchmark of reading configuration through attribute access: items,
+items in sections, sections, and command-line arguments not managed by
+MergeConf.
+
+Run from the top of the repository:
+
+    python benchmarks/access.py
+"""
+import argparse
+import timeit
+import mergeconf
+
+def build():
+  conf = mergeconf.MergeConf('bench')
+  conf.add('name', value='bench', cli=True)
+  conf.add_section('db').add('host', value='localhost', cli=True)
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--verbose', action='store_true')
+  conf.config_argparser(parser)
+  conf.merge(parser.parse_args(['--verbose']))
+  return conf
+
+def main():
+  conf = build()
+  cases = {
+    'item': lambda: conf.name,
+    'section': lambda: conf.db,
+    'item in section': lambda: conf.db.host,
+    'passthrough argument': lambda: conf.verbose,
+  }
+  number = 1000000
+  for label, fn in cases.items():
+    best = min(timeit.repeat(fn, number=number, repeat=5))
+    print(f"{label:>22}: {best / number * 1e9:7.1f} ns")
+
+if __name__ == '__main__':
+  main()
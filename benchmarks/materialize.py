@@ -0,0 +1,60 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+"""
+Benchmark of rendering a configuration file for each of many nodes from a
+shared base configuration and per-node override files, comparing a full
+build and merge for each node with `materialize()`.
+
+Run from the top of the repository:
+
+    python benchmarks/materialize.py [nodes] [processes]
+"""
+import os
+import sys
+import tempfile
+import time
+import mergeconf
+
+def define(conf):
+  for s in range(20):
+    section = conf.add_section(f"section{s}")
+    for i in range(25):
+      section.add(f"item{i}", value=i)
+  return conf
+
+def main():
+  nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+  with tempfile.TemporaryDirectory() as tmp:
+    base = os.path.join(tmp, 'base.conf')
+    with open(base, 'w') as f:
+      for s in range(20):
+        f.write(f"[section{s}]\nitem0 = {s}\n")
+    overrides = {}
+    for n in range(nodes):
+      path = os.path.join(tmp, f"node{n}.override")
+      with open(path, 'w') as f:
+        f.write(f"[section{n % 20}]\nitem1 = {n}\nitem2 = {n * 2}\n")
+      overrides[f"node{n}"] = path
+    out = os.path.join(tmp, 'out')
+    os.mkdir(out)
+
+    # one configuration built, merged and rendered per node
+    start = time.perf_counter()
+    for node, path in overrides.items():
+      conf = define(mergeconf.MergeConf('bench', files=[base, path]))
+      conf.merge()
+      with open(os.path.join(out, f"{node}.conf"), 'w') as f:
+        f.write(conf._render())
+    elapsed = time.perf_counter() - start
+    print(f"{'per node':>12}: {nodes / elapsed:8.0f} nodes/s")
+
+    conf = define(mergeconf.MergeConf('bench', files=base))
+    conf.merge()
+    result = conf.materialize(overrides, out, processes=1)
+    print(f"{'batch':>12}: {result.rate:8.0f} nodes/s")
+    result = conf.materialize(overrides, out, processes=processes)
+    print(f"{'batch, pool':>12}: {result.rate:8.0f} nodes/s")
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,63 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+"""
+Benchmark of declaring a large configuration: item by item with `add()`,
+compared to all at once with `add_many()` from a nested dictionary or from a
+list of tuples.
+
+Run from the top of the repository:
+
+    python benchmarks/schema.py [sections] [items per section]
+"""
+import sys
+import time
+import mergeconf
+
+def by_item(schema):
+  conf = mergeconf.MergeConf('bench')
+  for name, items in schema.items():
+    section = conf.add_section(name)
+    for key, spec in items.items():
+      section.add(key, **spec)
+  return conf
+
+def by_dict(schema):
+  return mergeconf.MergeConf.from_schema('bench', schema)
+
+def by_tuples(entries):
+  return mergeconf.MergeConf.from_schema('bench', entries)
+
+def main():
+  sections = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+  per_section = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+  schema = {
+    f"section{s}": {
+      f"item{i}": { 'value': i, 'description': f"Item {i}" }
+      for i in range(per_section)
+    }
+    for s in range(sections)
+  }
+  entries = [
+    (f"{name}.{key}", spec)
+    for name, items in schema.items() for key, spec in items.items()
+  ]
+
+  print(f"{sections * per_section} items in {sections} sections")
+  cases = {
+    'add()': (by_item, schema),
+    'add_many() dict': (by_dict, schema),
+    'add_many() tuples': (by_tuples, entries),
+  }
+  baseline = None
+  for label, (fn, arg) in cases.items():
+    best = None
+    for _ in range(5):
+      start = time.perf_counter()
+      fn(arg)
+      elapsed = time.perf_counter() - start
+      best = elapsed if best is None else min(best, elapsed)
+    baseline = baseline or best
+    print(f"{label:>18}: {best * 1000:8.1f} ms ({baseline / best:.1f}x)")
+
+if __name__ == '__main__':
+  main()
@@ -160,4 +160,7 @@ Note that:
 from .mergeconf import MergeConf
 from .mergeconfsection import MergeConfSection
 from .mergeconfitem import MergeConfItem
+from .mergeconfsnapshot import MergeConfSnapshot
+from .mergeconfhostlist import MergeConfHostlist
+from .mergeconfregistry import get_or_load, invalidate
 from . import exceptions
@@ -0,0 +1,216 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+"""
+Command-line tool printing configuration values for shell scripts, so that
+many values are read with a single merge rather than one process per value.
+
+    python -m mergeconf myapp --schema myapp.config:SCHEMA db.host db.port
+
+prints each value as an `export` statement, or as JSON with `--json`.  The
+schema attribute is a definition as for `MergeConf.add_many()`.  With
+`--cache`, the merged values are kept in a file and reused until the schema
+module, the configuration files or the application's environment variables
+change.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+from mergeconf import exceptions
+from mergeconf.mergeconf import MergeConf
+from mergeconf.mergeconflog import log
+
+# errors in the configuration or its definition, reported without a traceback;
+# ValueError is raised for values which cannot be converted to an item's type
+_errors = (
+  ValueError,
+  exceptions.MissingConfiguration,
+  exceptions.InvalidConfiguration,
+  exceptions.MissingConfigurationFile,
+  exceptions.UnsupportedType,
+  exceptions.UndefinedSection,
+  exceptions.UndefinedConfiguration,
+  exceptions.UndefinedReference,
+  exceptions.CircularReference,
+)
+
+def _schema_origin(spec):
+  """
+  Return the module and attribute names in the schema specification, and the
+  path of the module's source, found without importing the module.
+  """
+  import importlib.util
+  module, _, attr = spec.partition(':')
+  found = importlib.util.find_spec(module)
+  if found is None:
+    raise ImportError(f"No module named {module}")
+  return (module, attr or 'schema', found.origin)
+
+def _stat(path):
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+def _cache_key(args, origin, files):
+  """
+  Return a value which changes whenever the merged configuration may have,
+  or None if this cannot be determined.
+  """
+  if any(x.startswith(('http://', 'https://')) for x in files):
+    return None
+  import hashlib
+  prefix = f"{args.codename.upper()}_"
+  environ = hashlib.blake2b(repr(sorted(
+    x for x in os.environ.items() if x[0].startswith(prefix)
+  )).encode(), digest_size=16).hexdigest()
+  return [
+    args.codename, args.schema, _stat(origin),
+    [[x, _stat(x)] for x in files],
+    environ, args.strict, args.interpolate,
+  ]
+
+def _load_cache(path, key):
+  try:
+    with open(path) as f:
+      data = json.load(f)
+    if data['key'] == key:
+      return data['values']
+  except (OSError, ValueError, KeyError):
+    pass
+  return None
+
+def _store_cache(path, key, values):
+  # written under a unique name then renamed, as runs may share the cache
+  import tempfile
+  tmp = None
+  try:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+      prefix=f".{os.path.basename(path)}.")
+    with os.fdopen(fd, 'w') as f:
+      json.dump({'key': key, 'values': values}, f)
+    from mergeconf.mergeconfwriter import _umask
+    os.chmod(tmp, 0o666 & ~_umask())
+    os.replace(tmp, path)
+  except OSError as e:
+    log().debug("Unable to write cache %s: %s", path, e)
+    if tmp is not None and os.path.exists(tmp):
+      os.unlink(tmp)
+
+def _merge(args, module, attr):
+  """
+  Merge the configuration and return its values keyed by fully qualified
+  item name.
+  """
+  import importlib
+  schema = getattr(importlib.import_module(module), attr)
+  conf = MergeConf.from_schema(args.codename, schema, files=args.files,
+    strict=args.strict, interpolate=args.interpolate)
+  conf.merge()
+  buffer = io.StringIO()
+  conf.dump_json(buffer, flat=True)
+  return json.loads(buffer.getvalue())
+
+def _shell_value(value):
+  if isinstance(value, bool):
+    return 'true' if value else 'false'
+  if isinstance(value, list):
+    return ', '.join(str(x) for x in value)
+  return str(value)
+
+def _parser():
+  parser = argparse.ArgumentParser(prog='python -m mergeconf',
+    description="Print configuration values for use in shell scripts.")
+  parser.add_argument('codename',
+    help="codename of the configuration, prefixing its environment variables")
+  parser.add_argument('keys', nargs='*', metavar='key',
+    help="item in section-dot-item syntax; all items if none are given")
+  parser.add_argument('-s', '--schema', required=True,
+    metavar='MODULE[:ATTRIBUTE]',
+    help="module and attribute defining the configuration (default "
+      "attribute: schema)")
+  parser.add_argument('-f', '--file', dest='files', action='append',
+    metavar='FILE', help="configuration file, in order of importance; may be "
+      "given more than once")
+  parser.add_argument('--json', action='store_true',
+    help="print values as a JSON object rather than export statements")
+  parser.add_argument('--prefix',
+    help="prefix of the variable names in export statements (default: the "
+      "codename and an underscore)")
+  parser.add_argument('--cache', metavar='FILE',
+    help="file in which merged values are kept for later runs")
+  parser.add_argument('--no-strict', dest='strict', action='store_false',
+    help="accept sections and items not defined in the schema")
+  parser.add_argument('--interpolate', action='store_true',
+    help="replace references to other items in values")
+  return parser
+
+def main(argv=None):
+  """
+  Run the command-line tool.
+
+  Args:
+    argv (list): Arguments, or None for the process's arguments.
+
+  Returns:
+    Exit status.
+  """
+  parser = _parser()
+  # TODO(3.7): use `parse_intermixed_args()`; keys given after options are
+  # left over by `parse_known_args()`
+  args, extra = parser.parse_known_args(argv)
+  for arg in extra:
+    if arg.startswith('-'):
+      parser.error(f"unrecognized arguments: {' '.join(extra)}")
+  args.keys.extend(extra)
+
+  try:
+    module, attr, origin = _schema_origin(args.schema)
+  except ImportError as e:
+    parser.exit(2, f"{parser.prog}: {e}\n")
+
+  # as in `MergeConf.merge()`
+  from_env = os.environ.get(f"{args.codename.upper()}_CONFIG")
+  files = from_env.split(',') if from_env else args.files or []
+
+  values = None
+  key = _cache_key(args, origin, files) if args.cache else None
+  if key is not None:
+    values = _load_cache(args.cache, key)
+  if values is None:
+    import configparser
+    try:
+      values = _merge(args, module, attr)
+    except (_errors + (configparser.Error,)) as e:
+      parser.exit(1, f"{parser.prog}: {e}\n")
+    if key is not None:
+      _store_cache(args.cache, key, values)
+
+  names = args.keys or list(values)
+  undefined = [x for x in names if x not in values]
+  if undefined:
+    parser.exit(1,
+      f"{parser.prog}: Undefined configuration items: {', '.join(undefined)}\n")
+
+  if args.json:
+    json.dump({x: values[x] for x in names}, sys.stdout)
+    sys.stdout.write('\n')
+    return 0
+
+  import shlex
+  prefix = f"{args.codename}_" if args.prefix is None else args.prefix
+  lines = []
+  for name in names:
+    variable = f"{prefix}{name.replace('.', '_')}".upper()
+    value = values[name]
+    if value is None:
+      lines.append(f"unset {variable}")
+    else:
+      lines.append(f"export {variable}={shlex.quote(_shell_value(value))}")
+  sys.stdout.write(''.join(f"{x}\n" for x in lines))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
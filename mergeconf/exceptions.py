@@ -23,6 +23,25 @@ class MissingConfiguration(Exception):
   def missing(self):
     return self._missing
 
+class InvalidConfiguration(Exception):
+  """
+  Raised if configuration items have values violating their constraints.
+
+  Attributes:
+    violations: list of descriptions of each violation, each prefixed with
+      the item in section-dot-key notation.
+  """
+
+  def __init__(self, violations):
+    self._violations = violations
+
+    description = f"Invalid configuration: {'; '.join(violations)}"
+    super().__init__(description)
+
+  @property
+  def violations(self):
+    return self._violations
+
 class MissingConfigurationFile(Exception):
   """
   Raised if the specified configuration file is missing or otherwise
@@ -96,6 +115,46 @@ class UndefinedConfiguration(Exception):
   def item(self):
     return self._item
 
+class UndefinedReference(Exception):
+  """
+  Raised if a configuration value refers to an item that is not defined.
+
+  Attributes:
+    item: the item whose value contains the reference, in section-dot-key
+      notation
+    reference: the undefined item referred to
+  """
+  def __init__(self, item, reference):
+    self._item = item
+    self._reference = reference
+    description = f"Undefined item '{reference}' referenced by '{item}'"
+    super().__init__(description)
+
+  @property
+  def item(self):
+    return self._item
+
+  @property
+  def reference(self):
+    return self._reference
+
+class CircularReference(Exception):
+  """
+  Raised if configuration values refer to each other in a cycle.
+
+  Attributes:
+    cycle: list of items in section-dot-key notation forming the cycle,
+      starting and ending with the same item
+  """
+  def __init__(self, cycle):
+    self._cycle = cycle
+    description = f"Circular reference: {' -> '.join(cycle)}"
+    super().__init__(description)
+
+  @property
+  def cycle(self):
+    return self._cycle
+
 #class Deprecated(Exception):
 #  """
 #  Raised for hard deprecations where functionality has been removed and the
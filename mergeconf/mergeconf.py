@@ -1,11 +1,50 @@
 # vi: set softtabstop=2 ts=2 sw=2 expandtab:
 # pylint: disable=W0621
 import os
-import logging
-from configparser import ConfigParser
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
 from mergeconf import exceptions
+from mergeconf.mergeconfenv import environment
+from mergeconf.mergeconfhostlist import MergeConfHostlist
+from mergeconf.mergeconflog import log
 from mergeconf.mergeconfsection import MergeConfSection
+from mergeconf.mergeconfsubscriptions import MergeConfSubscriptions
 
+# Modules only needed on some code paths, such as `configparser` for files,
+# `json` or `logging` (through `log()`), are imported where they are used to
+# keep the package quick to import for short-lived processes.
+
+# differences between two configurations, as returned by MergeConf.diff()
+Diff = namedtuple('Diff', ['added', 'removed', 'changed'])
+
+# outcome of rendering configurations, as returned by MergeConf.materialize()
+Throughput = namedtuple('Throughput', ['nodes', 'seconds', 'rate'])
+
+def _writes(method):
+  """
+  Decorator for MergeConf methods which modify configuration values in place,
+  so that they are serialized with other writers and any published snapshot
+  is retired once the outermost write completes.
+  """
+  @wraps(method)
+  def wrapper(self, *args, **kwargs):
+    with self._writing():
+      return method(self, *args, **kwargs)
+  return wrapper
+
+def _json_value(value):
+  """
+  Return a JSON-serializable form of a value of a structured type, such as a
+  list item's `memoryview` or a host list.
+  """
+  if isinstance(value, memoryview):
+    return value.tolist()
+  if isinstance(value, MergeConfHostlist):
+    return str(value)
+  raise TypeError(f"Object of type {type(value).__name__} is not JSON "
+    "serializable")
 
 class MergeConf(MergeConfSection):
   """
@@ -19,7 +58,8 @@ class MergeConf(MergeConfSection):
   to define configuration items and sections and examine the configuration.
   """
 
-  def __init__(self, codename, files=None, map=None, strict=True):
+  def __init__(self, codename, files=None, map=None, strict=True,
+      interpolate=False):
     """
     Initializes MergeConf class.
 
@@ -39,6 +79,10 @@ class MergeConf(MergeConfSection):
         will cause an exception (`UndefinedSection` or `UndefinedConfiguration`,
         respectively).  If false, they will be added to the merged
         configuration.
+      interpolate (boolean): If true, references to other items in string
+        values, such as `${base}/logs` or `${section.item}`, are replaced by
+        the referenced items' values once merging is complete, whatever the
+        source of each value.  Use `$$` for a literal `$`.
 
     Note: The `map` argument is probably to be deprecated and removed at a
       later date.  Its utility is limited and should be avoided.
@@ -46,6 +90,27 @@ class MergeConf(MergeConfSection):
     super().__init__(None, map=map)
 
     self._args = None
+    self._passthrough = {}
+    self._validator = None
+    self._snapshot = None
+    self._lock = threading.RLock()
+    self._depth = 0
+    self._changes = {}
+    self._pending = {}
+    self._resolving = False
+    self._subscriptions = MergeConfSubscriptions()
+    self._environ = None
+    self._envvars = {}
+    self._envtable = None
+    self._envapplied = {}
+    self._clitable = None
+    self._exported = None
+    self._revision = 0
+    self._unsaved = {}
+    self._interpolator = None
+    if interpolate:
+      from mergeconf.mergeconfinterpolator import MergeConfInterpolator
+      self._interpolator = MergeConfInterpolator(self)
     self._codename = codename
     self._strict = strict
 
@@ -61,19 +126,327 @@ class MergeConf(MergeConfSection):
     self._main = '__app__'
 
     if map:
-      logging.warning("Support for `map` argument is deprecated and will " \
+      log().warning("Support for `map` argument is deprecated and will " \
         "be removed.  Please use `add()` to add configuration options and " \
         "their specifications, including default values.")
 
+  @classmethod
+  def from_schema(cls, codename, schema, **kwargs):
+    """
+    Create a configuration from a complete definition of its items and
+    sections.
+
+    Args:
+      codename (str): As for `MergeConf()`.
+      schema: Definition of the configuration, as for `add_many()`.
+      kwargs: Other arguments to `MergeConf()`.
+
+    Returns:
+      MergeConf object.
+    """
+    conf = cls(codename, **kwargs)
+    conf.add_many(schema)
+    return conf
+
   # overload this here in order to try and catch non-mergeconf CLI arguments
-  # if appropriate
+  # if appropriate.  These are looked up directly rather than by catching the
+  # exception from the parent implementation, as this is a common path.
   def __getattr__(self, attr):
+    if attr in self._items:
+      return self._items[attr].value
+    if attr in self._sections:
+      return self._sections[attr]._ensure_loaded()
+    if attr in self._passthrough:
+      return self._passthrough[attr]
+    raise AttributeError
+
+  def _schema_changed(self):
+    # validation plan must be recompiled to pick up the new definition
+    super()._schema_changed()
+    self._revision += 1
+    self._validator = None
+    self._snapshot = None
+
+    # environment must be applied in full to pick up new items
+    self._environ = None
+    self._envvars = {}
+    self._envtable = None
+    self._envapplied = {}
+    self._clitable = None
+    self._exported = None
+
+    if self._interpolator is not None:
+      self._interpolator.invalidate()
+
+  def _changed(self, item, old):
+    # record the original value of each item changed during a write
+    super()._changed(item, old)
+    self._exported = None
+    if item not in self._changes:
+      self._changes[item] = old
+    if not self._resolving:
+      self._pending[item] = None
+
+  @contextmanager
+  def _writing(self, publish=None):
+    """
+    Context for modifying configuration values in place.  Writers are
+    serialized, and when the outermost writer finishes the published snapshot
+    is replaced with the given one, or if any values changed retired so that
+    the next call to `snapshot()` builds a new one.  Subscribers are then notified of any
+    changes, outside of the lock, including changes made before a writer
+    failed.
+    """
+    changes = None
+    failed = False
     try:
-      return super().__getattr__(attr)
-    except AttributeError as e:
-      if self._args is not None and attr in vars(self._args):
-        return vars(self._args)[attr]
-      raise e
+      with self._lock:
+        self._depth += 1
+        try:
+          yield
+        except BaseException:
+          failed = True
+          raise
+        finally:
+          self._depth -= 1
+          if not self._depth:
+            try:
+              if not failed:
+                self._resolve()
+            finally:
+              # a snapshot of unchanged values is still current; changes to
+              # the definition retire it in `_schema_changed()`
+              if publish is not None or self._changes:
+                self._snapshot = publish
+              changes, self._changes = self._changes, {}
+    finally:
+      if changes and self._subscriptions:
+        self._notify(changes)
+
+  def _resolve(self):
+    """
+    Bring interpolated values up to date with the values set so far in the
+    current write.
+    """
+    interpolator = self._interpolator
+    if interpolator is not None and (self._pending or interpolator.stale):
+      pending, self._pending = self._pending, {}
+      # values set while resolving are not set by sources
+      self._resolving = True
+      try:
+        interpolator.update(list(pending))
+      finally:
+        self._resolving = False
+
+  def _notify(self, changes):
+    """
+    Notify subscribers of changed items.
+
+    Args:
+      changes: Dictionary of changed MergeConfItem objects to their values
+        before the changes.
+    """
+    named = {}
+    for item, old in changes.items():
+      if item.value != old:
+        trail = item._parent._trail() if item._parent is not None else []
+        named['.'.join(trail + [item.key])] = (old, item.value)
+    if named:
+      self._subscriptions.dispatch(named)
+
+  def subscribe(self, pattern, callback):
+    """
+    Subscribe to changes of configuration items.  After each merge (or other
+    modification through MergeConf methods) completes, every subscriber
+    interested in items whose values changed is called once.
+
+    Args:
+      pattern (str): Fully qualified item name in section-dot-item syntax, or
+        a shell-style wildcard pattern such as `db.*` for all items in the
+        `db` section and its subsections.
+      callback: Callable taking a dictionary of the changed item names
+        matching the pattern to tuples of their old and new values.
+    """
+    with self._lock:
+      self._subscriptions.add(pattern, callback)
+
+  def unsubscribe(self, pattern, callback):
+    """
+    Remove a subscription made with `subscribe()`.
+    """
+    with self._lock:
+      self._subscriptions.remove(pattern, callback)
+
+  def _raw(self, item):
+    """
+    Return the item's value before interpolation.
+    """
+    if self._interpolator is not None:
+      raw = self._interpolator.raw(item)
+      if raw is not None:
+        return raw
+    return item.value
+
+  def snapshot(self):
+    """
+    Return an immutable snapshot of the configuration's values.  Threads
+    reading the configuration while it may be reloaded should read a snapshot
+    rather than the configuration itself, so that all values read come from
+    the same reload.
+
+    Snapshots are published by `reload()` with a single reference swap, so
+    readers do not wait on reloads.  After a configuration is modified in place
+    (by `merge()` or the other `merge_*` methods), the next call builds and
+    publishes a new snapshot.
+
+    Returns:
+      MergeConfSnapshot object.
+    """
+    snapshot = self._snapshot
+    if snapshot is None:
+      with self._lock:
+        if self._snapshot is None:
+          self._snapshot = self._freeze()
+        snapshot = self._snapshot
+    return snapshot
+
+  def reload(self, args=None):
+    """
+    Merge the configuration again from its sources, as with `merge()`, but
+    into a copy of the configuration definition set to default values.  Once
+    the copy has been merged and validated, a snapshot of it is published for
+    `snapshot()` and then the values are brought into this configuration.
+
+    If merging or validation fails, the exception is raised and neither this
+    configuration nor the published snapshot are modified.
+
+    Args:
+      args: Arguments processed by ArgumentParser, as for `merge()`.
+    """
+    with self._lock:
+      staged = MergeConf(self._codename, files=self._files,
+        strict=self._strict, interpolate=self._interpolator is not None)
+      self._copy_definition(staged)
+      # validated through this configuration's plan, so that checks of values
+      # which have not changed are not evaluated again
+      plan = self._plan()
+      # sections loaded here are loaded in the copy too, so that their values
+      # are merged again
+      pending = [(self, staged)]
+      while pending:
+        section, copy = pending.pop()
+        for name, subsection in section._sections.items():
+          if subsection._loaded:
+            pending.append(
+              (subsection, copy._sections[name]._ensure_loaded(check=False)))
+      staged._validator = plan
+      staged.merge(args)
+      snapshot = staged._freeze()
+
+      # publish for readers, then update the live configuration
+      self._snapshot = snapshot
+      with self._writing(publish=snapshot):
+        loaded = []
+        for sections, name, item in staged._walk([]):
+          ref = self
+          for section in sections:
+            ref = ref.add_section(section)
+            if not ref._loaded:
+              loaded.append(ref)
+          # uninterpolated values so references continue to be followed
+          value = staged._raw(item)
+          if name in ref._items:
+            ref._items[name].value = value
+          else:
+            ref.add(name, value)
+        if loaded:
+          # loaded in the copy, so given their values from their files here
+          for section in loaded:
+            section._loaded = True
+          self._schema_changed()
+        if args is not None:
+          self._args = args
+          self._passthrough = staged._passthrough
+
+  def _clone(self):
+    """
+    Return a copy of the configuration definition and its current values.
+    """
+    clone = MergeConf(self._codename, files=self._files, strict=self._strict,
+      interpolate=self._interpolator is not None)
+    self._copy_definition(clone)
+    with clone._writing():
+      pending = [(self, clone)]
+      while pending:
+        section, copy = pending.pop()
+        copy._loaded = section._loaded
+        for name, item in section._items.items():
+          # uninterpolated values so references continue to be followed
+          copy._items[name].value = self._raw(item)
+        for name, subsection in section._sections.items():
+          if subsection._loaded:
+            pending.append((subsection, copy._sections[name]))
+    clone._args = self._args
+    clone._passthrough = dict(self._passthrough)
+    return clone
+
+  def _render(self):
+    """
+    Return a configuration file setting every defined item to its current
+    value.
+    """
+    return '\n'.join(
+      self._config_lines(self._interpolator is not None)).lstrip('\n') + '\n'
+
+  def materialize(self, overrides, directory, processes=None):
+    """
+    Render a configuration file for each of many nodes, from this
+    configuration as a base with each node's overrides merged on top.  The
+    base should already be merged, and is not modified other than to load any
+    lazily loaded sections.
+
+    The nodes are divided among a pool of worker processes, where the
+    platform supports forking them, each of which copies the base once and
+    then, for each node, merges the node's override files into its copy,
+    validates and renders the result, writes it to a file with a single
+    write, and sets the changed items back to their base values.
+
+    Args:
+      overrides (dict): Node names mapped to the path, or list of paths, of
+        configuration files merged on top of the base for that node, from
+        least to most important.
+      directory (str): Directory in which the configuration file for each node
+        is written, named as the node with `.conf` appended.
+      processes (int): Number of worker processes.  Defaults to the number of
+        CPUs.
+
+    Returns:
+      Named tuple of the number of `nodes` rendered, the elapsed `seconds`
+      and the `rate` in nodes per second.
+
+    Raises:
+      ValueError: if an item with a value is in a nested section, which the
+        file format cannot express.
+    """
+    import time
+    from mergeconf import mergeconfbatch
+    start = time.perf_counter()
+    # every section is rendered, so copies are made with all of them loaded,
+    # and anything which cannot be rendered is found before any are written
+    self._load_all()
+    self._render()
+    jobs = [
+      (node, (files,) if isinstance(files, str) else tuple(files),
+        os.path.join(directory, f"{node}.conf"))
+      for node, files in overrides.items()
+    ]
+    nodes = mergeconfbatch.materialize(self, jobs,
+      processes or os.cpu_count() or 1)
+    seconds = time.perf_counter() - start
+    throughput = Throughput(nodes, seconds, nodes / seconds if seconds else 0)
+    log().info("Rendered %d configurations in %.2fs (%.0f nodes/s)",
+      nodes, seconds, throughput.rate)
+    return throughput
 
   def map(self, fn):
     """
@@ -89,7 +462,25 @@ class MergeConf(MergeConfSection):
     """
     return self._map(fn, [])
 
-  def config_argparser(self, argparser):
+  def _cli_table(self):
+    """
+    Return the table of items to be included in command-line arguments, built
+    once per configuration definition.
+
+    Returns:
+      Dictionary of argument destinations, as named by ArgumentParser, to
+      tuples of (sections, name, MergeConfItem).
+    """
+    if self._clitable is None:
+      table = {}
+      for sections, name, item in self._walk([], unloaded=True):
+        if item.cli:
+          dest = '_'.join(sections + [name]).replace('-', '_')
+          table[dest] = (sections, name, item)
+      self._clitable = table
+    return self._clitable
+
+  def config_argparser(self, argparser, sections=None, lazy=False):
     """
     Configure ArgumentParser instance with designated configuration items.
 
@@ -102,27 +493,58 @@ class MergeConf(MergeConfSection):
     Arguments are configured with help text based on the configuration items'
     descriptions, if available.  Boolean configuration items do not take
     arguments but instead will set a value opposite of their default, or True
-    if not was defined.
+    if not was defined.  Items in sections are placed in an argument group
+    for the section.
 
     args:
       argparser: ArgumentParser object to populate with appropriate items.
+      sections (list): If given, only items in these sections, in dotted
+        notation, and their subsections are added.  Use None in the list for
+        items not in any section.  This is useful for configuring the parser
+        of a subcommand with only the sections relevant to it.
+      lazy (boolean): If true, the arguments are only added when the parser
+        is first used to parse arguments, such as when it is the parser for a
+        subcommand and that subcommand is given.
     """
-    def addargs(sections, name, item):
-      if item.cli:
-        argname = f"--{'-'.join(sections) + '-' if sections else ''}{name}"
-        kwargs = {
-          'help': item.description,
-          'default': item.value
-        }
-        if item.type == bool:
-          # the default action for a boolean should be store_true
-          kwargs['action'] = 'store_false' if item.value is True else 'store_true'
-        else:
-          kwargs['type'] = item.type
-          kwargs['metavar'] = name.upper()
-        argparser.add_argument(argname, **kwargs)
-    self.map(addargs)
+    if lazy:
+      parse_known_args = argparser.parse_known_args
+      def register_and_parse(*args, **kwargs):
+        del argparser.parse_known_args
+        self.config_argparser(argparser, sections)
+        return parse_known_args(*args, **kwargs)
+      argparser.parse_known_args = register_and_parse
+      return
+
+    groups = {}
+    for trail, name, item in self._cli_table().values():
+      section = '.'.join(trail) or None
+      if sections is not None and not any(
+          section == x or (x and section and section.startswith(x + '.'))
+          for x in sections):
+        continue
+
+      argname = f"--{'-'.join(trail) + '-' if trail else ''}{name}"
+      kwargs = {
+        'help': item.description,
+        'default': item.value
+      }
+      if item.type == bool:
+        # the default action for a boolean should be store_true
+        kwargs['action'] = 'store_false' if item.value is True else 'store_true'
+      else:
+        # lists and other structured types parse their own text
+        kwargs['type'] = item.type if item.type in (int, float, str) else str
+        kwargs['metavar'] = name.upper()
+
+      if section is None:
+        group = argparser
+      else:
+        group = groups.get(section)
+        if group is None:
+          group = groups[section] = argparser.add_argument_group(section)
+      group.add_argument(argname, **kwargs)
 
+  @_writes
   def merge_args(self, args):
     """
     Merge command-line arguments parsed by ArgumentParser.
@@ -135,18 +557,18 @@ class MergeConf(MergeConfSection):
       args: Arguments returned by parse_args().
     """
     argsd = vars(args)
-
-    def grokarg(sections, name, item):
-      if item.cli:
-        argname = f"{'_'.join(sections) + '_' if sections else ''}{name}"
-        if argname in argsd:
-          item.value = argsd[argname]
-
-    self.map(grokarg)
+    table = self._cli_table()
+    for dest, (_, _, item) in table.items():
+      if dest in argsd:
+        item.value = argsd[dest]
 
     # retain args for retrieving individual non-mergeconf CLI args
     self._args = args
+    self._passthrough = {
+      key: value for key, value in argsd.items() if key not in table
+    }
 
+  @_writes
   def merge_environment(self):
     """
     Using configuration definition, reads in variables from the environment
@@ -155,27 +577,47 @@ class MergeConf(MergeConfSection):
     a list: in this way variables outside the merged configuration context can
     be handled, such as a variable specifying an alternative config file.
 
+    The environment is scanned once for all configurations in the process,
+    with variables partitioned by codename, and only scanned again once it
+    has changed.  On subsequent calls only variables which have changed, or
+    whose items have since been modified by other sources, are applied.
+    Variables removed from the environment do not reset their items.
+
     Returns:
       Map of environment variables matching the application codename.  The
       keys will be stripped of the codename prefix and will be converted to
       lowercase.
     """
-    # add this to any environment variable names
-    prefix = self._codename.upper() + '_'
-
-    # get all environment variables starting with that prefix into dict with
-    # key stripped of prefix and made lowercase
-    envvars = {
-      # TODO(3.9): replace `split(prefix, 1)[1]` with `removeprefix(prefix)`
-      x[0].split(prefix, 1)[1].lower(): x[1]
-      for x in os.environ.items() if x[0].startswith(prefix)
-    }
+    # the environment is scanned once for every configuration in the process,
+    # and only again once it has changed
+    generation, envvars = environment.variables(self._codename.upper() + '_')
+    if generation == self._environ:
+      delta = ()
+    else:
+      delta = {
+        key for key, value in envvars.items()
+        if self._envvars.get(key) != value
+      }
+      self._environ = generation
+      self._envvars = envvars
 
-    self._merge_env(envvars)
+    # apply variables which have changed, and those whose items have been
+    # modified by something else since the variable was applied
+    if self._envtable is None:
+      self._envtable = {}
+      for sections, name, item in self._walk([]):
+        self._envtable.setdefault('_'.join(sections + [name]), []).append(item)
+    for key, value in envvars.items():
+      for item in self._envtable.get(key, ()):
+        if key in delta or (self._envapplied.get(item) != item._version
+            and self._raw(item) != value):
+          item.value = value
+          self._envapplied[item] = item._version
 
-    return envvars
+    return dict(envvars)
 
-  def merge_file(self, config_file):
+  @_writes
+  def merge_file(self, config_file, sections=None, persist_index=False):
     """
     Merge configuration defined in file.  File is expected to adhere to the
     format defined by ConfigParser, with `=` used as the delimiter and
@@ -183,58 +625,451 @@ class MergeConf(MergeConfSection):
     may include variables defined prior to any section header.
 
     Args:
-      config_file (str): Path to config file.
+      config_file (str): Path to config file, or HTTP or HTTPS URL of a file
+        served over HTTP.  Served files are revalidated rather than fetched
+        again if unchanged; see `mergeconfhttp.fetch()`.
+      sections (list): If given, only these sections of the file are merged.
+        Use None in the list for items defined prior to any section header.
+        The sections are found through an index of the byte range of each
+        section in the file, which is built on first use and cached until the
+        file changes, so the rest of the file is neither read nor parsed.
+      persist_index (boolean): If true, the index is also cached alongside the
+        file with `.idx` appended to the file's name, for use by other
+        processes.
+    """
+    content = None
+    if sections is not None and config_file.startswith(('http://', 'https://')):
+      # served files are read in full and only the given sections merged
+      config = self._parse(config_file)
+      wanted = {self._main if x is None else x for x in sections}
+      for section in config.sections():
+        if section not in wanted:
+          config.remove_section(section)
+      self._merge_parsed(config, {self._main: self}, self)
+      return
+    if sections is not None:
+      from mergeconf.mergeconfindex import MergeConfIndex
+      try:
+        index = MergeConfIndex.for_file(config_file, persist=persist_index)
+      except FileNotFoundError:
+        # pylint: disable=raise-missing-from
+        raise exceptions.MissingConfigurationFile(config_file)
+      content = index.read(sections)
+    self._merge_parsed(self._parse(config_file, content), {self._main: self},
+      self)
+
+  @_writes
+  def merge_sqlite(self, database, scopes, table='mergeconf'):
+    """
+    Merge configuration from rows in a SQLite database, such as overrides
+    for particular nodes or allocations.  The rows for all of the given scopes
+    are read with a single query, and cached until the database changes.
+    Unexpected sections or items are handled as with `merge_file()`.
+
+    Args:
+      database (str): Path to the database.
+      scopes (str or list): Scope or list of scopes whose rows are merged.
+        Scopes are applied in order listed, and so should be listed from
+        least to most important.
+      table (str): Table with `scope`, `section`, `key` and `value` columns.
+        Items outside of any section have a `section` of NULL or an empty
+        string, and subsections are given in section-dot-section syntax.
+    """
+    from mergeconf import mergeconfsqlite
+    if isinstance(scopes, str):
+      scopes = (scopes,)
+    refs = {}
+    for section, key, value in mergeconfsqlite.read(database, table, scopes):
+      if section == self._main:
+        section = None
+      ref = refs.get(section)
+      if ref is None:
+        ref = self
+        for name in section.split('.') if section else ():
+          if name in ref._sections:
+            # loaded first, so that its file does not overwrite these values
+            # later
+            ref = ref._sections[name]._ensure_loaded(check=False)
+            continue
+          if self._strict:
+            raise exceptions.UndefinedSection(section)
+          log().warning("Unexpected section in configuration: %s", section)
+          ref = ref.add_section(name)
+        refs[section] = ref
+
+      key = key.lower()
+      if key not in ref._items:
+        if self._strict:
+          raise exceptions.UndefinedConfiguration(section or None, key)
+        log().warning("Unexpected configuration item in section %s: %s",
+          section or None, key)
+        ref.add(key, value)
+      else:
+        ref._items[key].value = value
+
+  def _load_section(self, section, check=True):
     """
+    Load a lazily loaded section from its file, then apply any values for it
+    from the environment and command-line arguments already merged, so they
+    keep their precedence.
+
+    Args:
+      section: MergeConfSection object added with a backing file.
+      check: Whether to raise `MissingConfiguration` if mandatory items in the
+        section are undefined once loaded.  Sources loading the section only
+        to merge values into it leave this to validation.
+    """
+    with self._writing():
+      if section._loaded:
+        return
+      trail = section._trail()
+      log().debug("Loading section %s from %s", '.'.join(trail),
+        section._file)
+      content = None
+      if section._index:
+        from mergeconf.mergeconfindex import MergeConfIndex
+        try:
+          index = MergeConfIndex.for_file(section._file)
+        except FileNotFoundError:
+          # pylint: disable=raise-missing-from
+          raise exceptions.MissingConfigurationFile(section._file)
+        content = index.read([section._name])
+      self._merge_parsed(self._parse(section._file, content),
+        {self._main: section, section._name: section}, section)
+
+      prefix = '_'.join(trail) + '_'
+      section._merge_env({
+        key[len(prefix):]: value for key, value in self._envvars.items()
+        if key.startswith(prefix)
+      })
+      if self._args is not None:
+        argsd = vars(self._args)
+        for sections, name, item in section._walk(trail):
+          argname = '_'.join(sections + [name])
+          if item.cli and argname in argsd:
+            item.value = argsd[argname]
+
+      # left unloaded if incomplete, so that it is loaded again on next access
+      missing = [
+        f"{'.'.join(sections)}.{name}"
+        for sections, name, item in section._walk(trail)
+        if item.mandatory and item.value is None
+      ] if check else []
+      if missing:
+        raise exceptions.MissingConfiguration(', '.join(missing))
+
+      section._loaded = True
+      self._schema_changed()
+
+  def _parse(self, config_file, content=None):
+    """
+    Parse a configuration file, with any items defined prior to a section
+    header placed in the main section.
+
+    Args:
+      config_file (str): Path to config file, or HTTP or HTTPS URL.
+      content (str): Content to parse, if already read from the file.
+
+    Returns:
+      ConfigParser object.
+    """
+    from configparser import ConfigParser
     config = ConfigParser(delimiters='=', interpolation=None)
 
     # read configuration into string so we can prepend a pretend main section.
     # See definition of self._main for explanation.
-    try:
-      with open(config_file) as f:
-        config_content = f"[{self._main}]\n{f.read()}"
-    except FileNotFoundError:
-      # pylint: disable=raise-missing-from
-      raise exceptions.MissingConfigurationFile(config_file)
+    if content is None and config_file.startswith(('http://', 'https://')):
+      from mergeconf import mergeconfhttp
+      content = mergeconfhttp.fetch(config_file)
+    if content is None:
+      try:
+        with open(config_file) as f:
+          content = f.read()
+      except FileNotFoundError:
+        # pylint: disable=raise-missing-from
+        raise exceptions.MissingConfigurationFile(config_file)
+    config_content = f"[{self._main}]\n{content}"
 
     # read configuration
     config.read_string(config_content, source=config_file)
+    return config
 
-    # read into stuffs
+  def _merge_parsed(self, config, targets, base):
+    """
+    Merge parsed configuration into sections.
+
+    Args:
+      config: ConfigParser object.
+      targets: Dictionary of section names in the parsed configuration to the
+        MergeConfSection objects they are merged into.
+      base: Section in which to look for, or add, any other sections.
+    """
     for section in config.sections():
-      if section == self._main:
-        ref = self
-      elif section not in self._sections:
+      ref = targets.get(section)
+      if ref is None:
+        ref = base._sections.get(section)
+        if ref is not None:
+          # loaded first, so that its file does not overwrite these values
+          # later
+          ref._ensure_loaded(check=False)
+      if ref is None:
         # unrecognized configuration section
         if self._strict:
           raise exceptions.UndefinedSection(section)
-        logging.warning("Unexpected section in configuration: %s", section)
-        ref = self.add_section(section)
-      else:
-        ref = self._sections[section]
+        log().warning("Unexpected section in configuration: %s", section)
+        ref = base.add_section(section)
       for option in config.options(section):
         if option not in ref._items:
           if self._strict:
             raise exceptions.UndefinedConfiguration(section, option)
-          logging.warning("Unexpected configuration item in section %s: %s",
+          log().warning("Unexpected configuration item in section %s: %s",
             section, option)
           ref.add(option, config[section][option])
         else:
           ref._items[option].value = config[section][option]
 
+  def diff(self, other):
+    """
+    Compare this configuration with another.  Each section's contents are
+    hashed and the hashes cached until an item in the section changes, so
+    sections which are the same in both configurations are skipped without
+    looking at their items.  Any lazily loaded sections are loaded.
+
+    Args:
+      other (MergeConf): Configuration to compare against.
+
+    Returns:
+      Named tuple of three dictionaries keyed by fully qualified item names in
+      section-dot-item syntax: `added`, items only in `other`, with their
+      values; `removed`, items only in this configuration, with their values;
+      and `changed`, items whose values differ, with a tuple of this
+      configuration's value and the other's.
+    """
+    self._load_all()
+    other._load_all()
+    added, removed, changed = {}, {}, {}
+    self._diff(other, [], added, removed, changed)
+    return Diff(added, removed, changed)
+
+  def fingerprint(self):
+    """
+    Return a hash of the effective configuration, suitable for use as a cache
+    key.  The hash does not depend on the order in which items were defined
+    or merged and is stable across processes.
+
+    The hash is maintained as a tree of hashes over sections and items, and
+    when items change only the hashes on the path from the item to the top of
+    the configuration are recalculated.  Any lazily loaded sections are
+    loaded.
+
+    Returns:
+      Hexadecimal string.
+    """
+    self._load_all()
+    return self._content_digest().hex()
+
+  def to_environ(self):
+    """
+    Return the configuration as environment variables, named and formatted
+    so that `merge_environment()` in another process with the same
+    definition reproduces the configuration's values.  This is the reverse of
+    `merge_environment()`, for passing the configuration to child processes.
+
+    The result is cached until the configuration changes, so it may be
+    requested for every child process cheaply.  Any lazily loaded sections
+    are loaded.
+
+    Returns:
+      Read-only mapping of variable names to values.  Items without a
+      defined value are left out.
+    """
+    exported = self._exported
+    if exported is None:
+      self._load_all()
+      with self._lock:
+        if self._exported is None:
+          from types import MappingProxyType
+          prefix = self._codename.upper()
+          environ = {}
+          for sections, name, item in self._walk([prefix]):
+            value = item.value
+            if value is None:
+              continue
+            if item.type == bool:
+              value = 'true' if value else 'false'
+            else:
+              value = item._str()
+              if self._interpolator is not None:
+                value = value.replace('$', '$$')
+            environ['_'.join(sections + [name]).upper()] = value
+          self._exported = MappingProxyType(environ)
+        exported = self._exported
+    return exported
+
+  def dump_json(self, fileobj, flat=False, **kwargs):
+    """
+    Write the merged configuration to a file object as JSON.  Values are
+    written with their native types.  Any lazily loaded sections are loaded.
+
+    Args:
+      fileobj: Writable text file object.
+      flat (boolean): If true, write a single object keyed by fully qualified
+        item names in section-dot-item syntax.  Otherwise, sections are
+        written as nested objects, as with `to_dict()`.
+      kwargs: Passed on to `json.dump()`, for example `indent`.
+    """
+    if flat:
+      self._load_all()
+      data = {
+        f"{'.'.join(sections) + '.' if sections else ''}{name}": item.value
+        for sections, name, item in self._walk([])
+      }
+    else:
+      data = self.to_dict()
+    import json
+    kwargs.setdefault('default', _json_value)
+    json.dump(data, fileobj, **kwargs)
+
+  @_writes
+  def load_json(self, fileobj, validate=True):
+    """
+    Merge configuration from JSON written by `dump_json()`, in either the
+    nested or flat layout (or a mixture of both).  Values already of the
+    item's type are used as-is.  Unexpected sections or items are handled as
+    with `merge_file()`.
+
+    Args:
+      fileobj: Readable text file object.
+      validate (boolean): If true, raise `MissingConfiguration` if mandatory
+        items are undefined after loading.  This is checked while merging
+        rather than with a separate pass.  Other constraints are then checked
+        as with `validate()`.
+    """
+    import json
+    data = {}
+    for key, value in json.load(fileobj).items():
+      if '.' in key and not isinstance(value, dict):
+        *sections, name = key.split('.')
+        ref = data
+        for section in sections:
+          ref = ref.setdefault(section, {})
+        ref[name] = value
+      elif isinstance(value, dict) and isinstance(data.get(key), dict):
+        data[key].update(value)
+      else:
+        data[key] = value
+
+    missing = []
+    self._merge_dict(data, [], self._strict, missing)
+    if validate:
+      if missing:
+        raise exceptions.MissingConfiguration(', '.join(missing))
+      self.validate()
+
+  @_writes
+  def set(self, name, value):
+    """
+    Set an item's value.  The item is then written by the next call to
+    `save()`.
+
+    Args:
+      name (str): Fully qualified item name in section-dot-item syntax.
+      value: New value, of the item's type or as a string.
+
+    Raises:
+      UndefinedSection: if the section is not defined.
+      UndefinedConfiguration: if the item is not defined.
+    """
+    *sections, key = name.split('.')
+    ref = self
+    for section in sections:
+      if section not in ref._sections:
+        raise exceptions.UndefinedSection('.'.join(sections))
+      ref = ref._sections[section]._ensure_loaded()
+    if key not in ref._items:
+      raise exceptions.UndefinedConfiguration('.'.join(sections) or None, key)
+    item = ref._items[key]
+    item.value = value
+    self._unsaved[item] = None
+
+  def save(self, path):
+    """
+    Write the items set with `set()` since the last save to a configuration
+    file in the format read by `merge_file()`.  Only the lines defining those
+    items are rewritten, and the rest of the file, including comments and
+    ordering, is copied unchanged without being parsed.  Items not already in
+    the file are added at the end of their section, and sections not already
+    in the file at the end of the file.  Items without a value are commented
+    out.  The file is replaced atomically, so readers see either the old or
+    the new file.
+
+    Args:
+      path (str): Path to the configuration file.  It is created if it does
+        not exist.
+
+    Raises:
+      ValueError: if an item to be written is in a nested section, which the
+        file format cannot express.
+    """
+    from mergeconf import mergeconfwriter
+    with self._lock:
+      changes = []
+      for item in self._unsaved:
+        trail = item._parent._trail() if item._parent is not None else []
+        if len(trail) > 1:
+          raise ValueError(
+            f"Cannot save nested item {'.'.join(trail + [item.key])}")
+        value = None
+        if item.value is not None:
+          value = self._interpolator.raw(item) \
+            if self._interpolator is not None else None
+          if value is None:
+            value = item._str()
+            if self._interpolator is not None:
+              value = value.replace('$', '$$')
+        changes.append((trail[0] if trail else None, item.key, value))
+      mergeconfwriter.save(path, changes, self._main)
+      self._unsaved = {}
+
   def validate(self):
     """
-    Checks that mandatory items have been defined in configuration.  If not,
-    throws exception.  Client may also use `missing_mandatory()`.
+    Checks that mandatory items have been defined in configuration and that
+    items satisfy any constraints given in `add()`.  If not, throws exception.
+    Client may also use `missing_mandatory()`.
+
+    The checks are compiled into a validation plan the first time through and
+    only checks involving items changed since the last validation are
+    evaluated again.
 
     Subclasses may add additional validation but should first call the parent
     implementation as the test for mandatory items is primary.
+
+    Raises:
+      MissingConfiguration: if mandatory items are undefined.
+      InvalidConfiguration: if any item violates its constraints.  All
+        violations are reported.
     """
-    # TODO(3.8): use walrus operator
-    # if unfulfilled := self.missing_mandatory():
-    unfulfilled = self.missing_mandatory()
+    if self._interpolator is not None and \
+        (self._pending or self._interpolator.stale):
+      # constraints apply to interpolated values
+      with self._writing():
+        self._resolve()
+    unfulfilled, violations = self._plan().run(self)
     if unfulfilled:
       raise exceptions.MissingConfiguration(', '.join(unfulfilled))
+    if violations:
+      raise exceptions.InvalidConfiguration(violations)
 
+  def _plan(self):
+    """
+    Return the validation plan, compiling it if the definition has changed.
+    """
+    if self._validator is None:
+      from mergeconf.mergeconfvalidator import MergeConfValidator
+      self._validator = MergeConfValidator(self)
+    return self._validator
+
+  @_writes
   def merge(self, args=None):
     """
     Takes configuration definition and any configuration files specified and
@@ -259,7 +1094,7 @@ class MergeConf(MergeConfSection):
     # if we have config files, merge into config
     if config_files:
       for config_file in config_files:
-        logging.debug("Merging in config file %s", config_file)
+        log().debug("Merging in config file %s", config_file)
         self.merge_file(config_file)
 
     # override with variables set in environment
@@ -300,7 +1135,33 @@ class MergeConf(MergeConfSection):
       description =
       ```
     """
-    # The internal method for building sample config will always append an
-    # extra empty string.  Get rid of this before joining all the lines
-    # together with a newline to build the "file".
-    return '\n'.join(self._sample_config()[:-1])
+    return '\n'.join(self.iter_sample_config())
+
+  def iter_sample_config(self):
+    """
+    Generate the lines of a sample configuration, as returned by
+    `sample_config()`, without line endings.  Lines are generated as the
+    configuration is traversed rather than built up in memory.
+    """
+    # The internal method for building sample config will always generate an
+    # extra line.  Hold each line back until the next is known so this can
+    # be left out.
+    lines = self._sample_config()
+    previous = next(lines, None)
+    for line in lines:
+      yield previous
+      previous = line
+
+  def write_sample_config(self, fileobj):
+    """
+    Write a sample configuration, identical to that returned by
+    `sample_config()`, to a file as it is generated.
+
+    Args:
+      fileobj: File-like object open for writing text.
+    """
+    lines = self.iter_sample_config()
+    for line in lines:
+      fileobj.write(line)
+      break
+    fileobj.writelines(f"\n{line}" for line in lines)
@@ -0,0 +1,153 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=protected-access,global-statement
+"""
+Rendering of configuration files for many nodes from a base configuration
+and per-node overrides, across a pool of processes.
+
+Each worker holds a working copy of the base configuration.  For each node
+the overrides are merged into it, the result is validated and rendered, and
+the items changed by the overrides are then set back to their base values,
+so that the cost for each node is that of its overrides rather than of the
+whole configuration.
+"""
+import itertools
+import os
+from mergeconf.mergeconflog import log
+
+# the worker process's working copy, set when the process starts
+_worker = None
+
+# TODO(3.7): remove; before 3.7 a pool cannot be given an initializer, so the
+# bases of pools being started are kept here by token to be inherited by the
+# forked workers
+_bases = {}
+_tokens = itertools.count()
+
+class _Worker:
+  """
+  Working copy of a base configuration, and the revision of its definition.
+  """
+
+  __slots__ = ('base', 'conf', 'revision')
+
+  def __init__(self, base):
+    self.base = base
+    self.reset()
+
+  def reset(self):
+    """
+    Make a new working copy of the base configuration.
+    """
+    self.conf = self.base._clone()
+    self.revision = self.conf._revision
+
+  def render(self, node, files):
+    """
+    Merge the node's overrides into the working copy, then return the
+    rendered configuration and restore the working copy to the base values.
+    """
+    conf = self.conf
+    interpolator = conf._interpolator
+    raws = dict(interpolator._raw) if interpolator is not None else {}
+    changed = None
+    try:
+      with conf._writing():
+        for config_file in files:
+          conf.merge_file(config_file)
+        changed = dict(conf._changes)
+      conf.validate()
+      return conf._render()
+    except Exception:
+      log().error("Unable to render configuration for %s", node)
+      raise
+    finally:
+      if changed is None or conf._revision != self.revision:
+        # overrides added items or sections, or failed part way, so start
+        # again from the base
+        self.reset()
+      else:
+        with conf._writing():
+          for item, old in changed.items():
+            item.value = raws.get(item, old)
+
+  def render_chunk(self, chunk):
+    """
+    Render and write the configuration for each (node, files, path) in the
+    chunk.
+
+    Returns:
+      Number of nodes rendered.
+    """
+    for node, files, path in chunk:
+      _write(path, self.render(node, files))
+    return len(chunk)
+
+def _init(base):
+  """
+  Make the working copy for a worker process.
+  """
+  global _worker
+  _worker = _Worker(base)
+
+def _render_chunk(chunk, token=None):
+  if _worker is None:
+    _init(_bases[token])
+  return _worker.render_chunk(chunk)
+
+def _write(path, content):
+  """
+  Write a file, with a single system call unless it is cut short.
+  """
+  data = memoryview(content.encode())
+  fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+  try:
+    while data:
+      data = data[os.write(fd, data):]
+  finally:
+    os.close(fd)
+
+def materialize(base, jobs, processes):
+  """
+  Render and write the configuration for each job, in a pool of processes if
+  the platform supports forking them.
+
+  Args:
+    base: Merged MergeConf object.
+    jobs: List of (node, files, path) tuples.
+    processes (int): Number of worker processes.
+
+  Returns:
+    Number of nodes rendered.
+  """
+  import multiprocessing
+  if processes < 2 or len(jobs) < 2 \
+      or 'fork' not in multiprocessing.get_all_start_methods():
+    return _Worker(base).render_chunk(jobs)
+
+  import sys
+  from concurrent.futures import ProcessPoolExecutor
+  size = max(1, len(jobs) // (processes * 4))
+  # the base is inherited by the forked workers rather than pickled
+  token = None
+  if sys.version_info >= (3, 7):
+    kwargs = {'mp_context': multiprocessing.get_context('fork'),
+      'initializer': _init, 'initargs': (base,)}
+  else:
+    # processes are forked by default, on the first submission
+    kwargs = {}
+    token = next(_tokens)
+    _bases[token] = base
+  try:
+    with ProcessPoolExecutor(processes, **kwargs) as executor:
+      futures = [
+        executor.submit(_render_chunk, jobs[i:i + size], token)
+        for i in range(0, len(jobs), size)
+      ]
+      try:
+        return sum(future.result() for future in futures)
+      except BaseException:
+        for future in futures:
+          future.cancel()
+        raise
+  finally:
+    _bases.pop(token, None)
@@ -0,0 +1,75 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=protected-access
+import os
+import threading
+
+class MergeConfEnvironment:
+  """
+  Scanner of the environment shared by every configuration in the process.
+
+  Configurations register the prefix of their variables, and the environment
+  is scanned once for all of them, with the variables partitioned by prefix.
+  The environment is only scanned again once it changes or a new prefix is
+  registered, so the cost of merging the environment into several
+  configurations is that of a single scan rather than one scan each.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._prefixes = set()
+    self._lengths = ()
+    self._environ = None
+    self._partitions = {}
+    self._generation = 0
+    self._scans = 0
+
+  @staticmethod
+  def _current():
+    # comparing against the environment as last seen is much cheaper than
+    # scanning it
+    environ = getattr(os.environ, '_data', None)
+    if environ is None:
+      environ = dict(os.environ)
+    return environ
+
+  def _scan(self, environ):
+    """
+    Partition the environment's variables by registered prefix, with names
+    stripped of the prefix and made lowercase.
+    """
+    partitions = { prefix: {} for prefix in self._prefixes }
+    lengths = self._lengths
+    for name, value in os.environ.items():
+      for length in lengths:
+        partition = partitions.get(name[:length])
+        if partition is not None:
+          partition[name[length:].lower()] = value
+    self._environ = dict(environ)
+    self._partitions = partitions
+    self._generation += 1
+    self._scans += 1
+
+  def variables(self, prefix):
+    """
+    Return the variables in the environment with the given prefix.
+
+    Args:
+      prefix (str): Prefix of the variables, including any separator.
+
+    Returns:
+      Tuple of a number which changes whenever the environment is scanned
+      again, and a dictionary of the variables with names stripped of the
+      prefix and made lowercase.  The dictionary must not be modified.
+    """
+    with self._lock:
+      if prefix not in self._prefixes:
+        self._prefixes.add(prefix)
+        self._lengths = tuple(sorted({len(x) for x in self._prefixes}))
+        self._environ = None
+      environ = self._current()
+      if self._environ is None or environ != self._environ:
+        self._scan(environ)
+      return (self._generation, self._partitions[prefix])
+
+# shared by all configurations
+environment = MergeConfEnvironment()
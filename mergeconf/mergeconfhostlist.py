@@ -0,0 +1,231 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+from bisect import bisect_right
+from itertools import product
+
+class MergeConfHostlist:
+  """
+  Set of host names in range-compressed form, such as
+  `cdr[001-1200,1305],login[1-2]`, as used on HPC clusters.  Use as the type
+  of a configuration item to have its value parsed into one.
+
+  Only the compressed form is kept.  The number of hosts, individual hosts by
+  position, slices, membership and iteration are all worked out from the
+  ranges, without expanding the whole list.
+
+  Each comma-separated term is a host name containing any number of bracketed
+  lists of numbers and ranges, for example `rack[1-2]n[01-16]`.  Numbers are
+  zero-padded to the width of the start of their range, and the last bracket
+  varies fastest.  Hosts are kept in the order given.
+  """
+
+  __slots__ = ('_text', '_terms', '_offsets', '_patterns')
+
+  def __init__(self, text):
+    """
+    Parse a range-compressed host list.
+
+    Args:
+      text (str): Host list.  Whitespace around terms is ignored.
+
+    Raises:
+      ValueError: if the host list is malformed.
+    """
+    if isinstance(text, MergeConfHostlist):
+      text = text._text
+    texts = list(self._split(text))
+    terms = [self._parse_term(term) for term in texts]
+    self._text = ','.join(texts)
+    self._terms = terms
+
+    # index of the first host of each term
+    self._offsets = []
+    total = 0
+    for _, size in terms:
+      self._offsets.append(total)
+      total += size
+    self._offsets.append(total)
+    self._patterns = None
+
+  @staticmethod
+  def _split(text):
+    """
+    Generate the terms of the host list, split at commas outside brackets.
+    """
+    depth, start = 0, 0
+    for i, c in enumerate(text):
+      if c == '[':
+        depth += 1
+      elif c == ']':
+        depth -= 1
+      elif c == ',' and not depth:
+        if text[start:i].strip():
+          yield text[start:i].strip()
+        start = i + 1
+    if depth:
+      raise ValueError(f"Unbalanced brackets in host list: {text}")
+    if text[start:].strip():
+      yield text[start:].strip()
+
+  @staticmethod
+  def _parse_ranges(group, term):
+    """
+    Parse the contents of a bracket into a tuple of (start, stop, width)
+    ranges, inclusive of stop, and the number of hosts covered.
+    """
+    ranges = []
+    size = 0
+    for spec in group.split(','):
+      first, _, last = spec.strip().partition('-')
+      last = last or first
+      if not (first.isdigit() and last.isdigit()) or int(last) < int(first):
+        raise ValueError(f"Invalid range '{spec}' in host list: {term}")
+      ranges.append((int(first), int(last), len(first)))
+      size += int(last) - int(first) + 1
+    return (tuple(ranges), size)
+
+  @classmethod
+  def _parse_term(cls, term):
+    """
+    Parse a term into a list alternating literal strings and parsed bracket
+    contents, starting and ending with a literal, and the number of hosts it
+    covers.
+    """
+    parts = []
+    size = 1
+    pos = 0
+    while True:
+      start = term.find('[', pos)
+      if start < 0:
+        parts.append(term[pos:])
+        break
+      end = term.find(']', start)
+      if end < 0 or ']' in term[pos:start] or '[' in term[start + 1:end]:
+        raise ValueError(f"Unbalanced brackets in host list: {term}")
+      parts.append(term[pos:start])
+      group = cls._parse_ranges(term[start + 1:end], term)
+      parts.append(group)
+      size *= group[1]
+      pos = end + 1
+    if ']' in parts[-1]:
+      raise ValueError(f"Unbalanced brackets in host list: {term}")
+    return (parts, size)
+
+  @staticmethod
+  def _number(group, index):
+    """
+    Return the formatted number at the given position in a bracket.
+    """
+    for first, last, width in group[0]:
+      count = last - first + 1
+      if index < count:
+        return f"{first + index:0{width}d}"
+      index -= count
+    raise IndexError(index)
+
+  @staticmethod
+  def _numbers(group):
+    for first, last, width in group[0]:
+      for n in range(first, last + 1):
+        yield f"{n:0{width}d}"
+
+  def __len__(self):
+    return self._offsets[-1]
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in range(*index.indices(len(self)))]
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError('host list index out of range')
+
+    term = bisect_right(self._offsets, index) - 1
+    parts, _ = self._terms[term]
+    index -= self._offsets[term]
+
+    # the last bracket varies fastest
+    names = [parts[-1]]
+    for i in range(len(parts) - 2, 0, -2):
+      group = parts[i]
+      index, position = divmod(index, group[1])
+      names.append(self._number(group, position))
+      names.append(parts[i - 1])
+    return ''.join(reversed(names))
+
+  def __iter__(self):
+    for parts, _ in self._terms:
+      literals = parts[0::2]
+      for numbers in product(*(self._numbers(g) for g in parts[1::2])):
+        name = [literals[0]]
+        for number, literal in zip(numbers, literals[1:]):
+          name.append(number)
+          name.append(literal)
+        yield ''.join(name)
+
+  def __contains__(self, name):
+    if not isinstance(name, str):
+      return False
+    if self._patterns is None:
+      import re
+      self._patterns = [
+        re.compile(r'(\d+)'.join(re.escape(x) for x in parts[0::2]))
+        for parts, _ in self._terms
+      ]
+    for pattern, (parts, _) in zip(self._patterns, self._terms):
+      # the pattern rules out most names quickly, but adjacent brackets or
+      # digits in literals may split the digits in more than one way
+      if pattern.fullmatch(name) and self._matches(parts, name, 0, 0):
+        return True
+    return False
+
+  @staticmethod
+  def _in_group(group, digits):
+    n = int(digits)
+    return any(
+      first <= n <= last and digits == f"{n:0{width}d}"
+      for first, last, width in group[0]
+    )
+
+  @classmethod
+  def _matches(cls, parts, name, i, pos):
+    """
+    Return whether the name from `pos` matches the term's parts from `i`,
+    trying every split of digits between adjacent brackets.
+    """
+    literal = parts[i]
+    if not name.startswith(literal, pos):
+      return False
+    pos += len(literal)
+    if i == len(parts) - 1:
+      return pos == len(name)
+    end = pos
+    while end < len(name) and name[end].isdigit():
+      end += 1
+    group = parts[i + 1]
+    return any(
+      cls._in_group(group, name[pos:stop])
+        and cls._matches(parts, name, i + 2, stop)
+      for stop in range(end, pos, -1)
+    )
+
+  def __eq__(self, other):
+    if isinstance(other, MergeConfHostlist):
+      return self._text == other._text
+    return NotImplemented
+
+  def __hash__(self):
+    return hash(self._text)
+
+  def __str__(self):
+    return self._text
+
+  def __repr__(self):
+    return f"MergeConfHostlist({self._text!r})"
+
+  def __getstate__(self):
+    return self._text
+
+  def __setstate__(self, state):
+    # pylint: disable=unnecessary-dunder-call
+    self.__init__(state)
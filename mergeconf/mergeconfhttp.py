@@ -0,0 +1,166 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+import http.client
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+from mergeconf import exceptions
+
+# idle keep-alive connections, by scheme, host and port
+_lock = threading.Lock()
+_pool = {}
+
+# responses fetched in this process, by URL, as tuples of ETag,
+# Last-Modified and body
+_responses = {}
+
+# directory in which responses are also cached for other processes, if set
+cache_env = 'MERGECONF_HTTP_CACHE'
+
+def _connect(origin):
+  with _lock:
+    idle = _pool.get(origin)
+    if idle:
+      return (idle.pop(), True)
+  scheme, host, port = origin
+  if scheme == 'https':
+    return (http.client.HTTPSConnection(host, port, timeout=30), False)
+  return (http.client.HTTPConnection(host, port, timeout=30), False)
+
+def _release(origin, connection):
+  with _lock:
+    _pool.setdefault(origin, []).append(connection)
+
+def _cache_file(url):
+  directory = os.environ.get(cache_env)
+  if not directory:
+    return None
+  import hashlib
+  name = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+  return os.path.join(directory, f"{name}.json")
+
+def _cached(url):
+  """
+  Return the cached response for the URL, from this process or the cache
+  directory, or None.
+  """
+  cached = _responses.get(url)
+  if cached is None:
+    path = _cache_file(url)
+    if path is not None:
+      try:
+        with open(path) as f:
+          data = json.load(f)
+        cached = (data['etag'], data['last_modified'], data['body'])
+      except (OSError, ValueError, KeyError):
+        pass
+  return cached
+
+def _store(url, cached):
+  _responses[url] = cached
+  path = _cache_file(url)
+  if path is not None:
+    # written under a unique name then renamed, as processes share the cache
+    import tempfile
+    from mergeconf.mergeconfwriter import _umask
+    etag, last_modified, body = cached
+    tmp = None
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+        prefix=f".{os.path.basename(path)}.")
+      with os.fdopen(fd, 'w') as f:
+        json.dump({'url': url, 'etag': etag, 'last_modified': last_modified,
+          'body': body}, f)
+      os.chmod(tmp, 0o666 & ~_umask())
+      os.replace(tmp, path)
+    except OSError as e:
+      logging.debug("Unable to cache %s in %s: %s", url, path, e)
+      if tmp is not None and os.path.exists(tmp):
+        os.unlink(tmp)
+
+def _request(origin, target, headers):
+  """
+  Send a GET request over a pooled connection, retrying once on a fresh
+  connection if a pooled one turns out to have been closed by the server.
+
+  Returns:
+    Tuple of the response and its body.
+  """
+  while True:
+    connection, pooled = _connect(origin)
+    try:
+      connection.request('GET', target, headers=headers)
+      response = connection.getresponse()
+      body = response.read()
+    except (http.client.RemoteDisconnected, ConnectionResetError,
+        BrokenPipeError):
+      connection.close()
+      if pooled:
+        continue
+      raise
+    except BaseException:
+      connection.close()
+      raise
+    if response.will_close:
+      connection.close()
+    else:
+      _release(origin, connection)
+    return (response, body)
+
+def fetch(url):
+  """
+  Fetch a configuration file served over HTTP.  Connections are kept alive
+  and reused, and responses are cached and revalidated with `If-None-Match`
+  and `If-Modified-Since`, so that an unchanged file costs a single
+  `304 Not Modified` response.
+
+  Responses are cached in memory, and also in files in the directory named
+  by the `MERGECONF_HTTP_CACHE` environment variable, if set, so that other
+  processes may revalidate them.
+
+  Args:
+    url (str): URL of the configuration file.
+
+  Returns:
+    Content of the configuration file.
+
+  Raises:
+    MissingConfigurationFile: if the file could not be fetched.
+  """
+  parts = urlsplit(url)
+  origin = (parts.scheme, parts.hostname, parts.port)
+  target = parts.path or '/'
+  if parts.query:
+    target += f"?{parts.query}"
+
+  cached = _cached(url)
+  headers = {}
+  if cached is not None:
+    etag, last_modified, _ = cached
+    if etag:
+      headers['If-None-Match'] = etag
+    if last_modified:
+      headers['If-Modified-Since'] = last_modified
+
+  try:
+    response, body = _request(origin, target, headers)
+  except (OSError, http.client.HTTPException) as e:
+    raise exceptions.MissingConfigurationFile(url) from e
+
+  if response.status == 304 and cached is not None:
+    logging.debug("Configuration at %s not modified", url)
+    _responses[url] = cached
+    return cached[2]
+  if response.status != 200:
+    logging.debug("Fetching %s failed: %s %s", url, response.status,
+      response.reason)
+    raise exceptions.MissingConfigurationFile(url)
+
+  charset = response.headers.get_content_charset() or 'utf-8'
+  content = body.decode(charset)
+  _store(url, (response.getheader('ETag'), response.getheader('Last-Modified'),
+    content))
+  return content
@@ -0,0 +1,129 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+import json
+import logging
+import mmap
+import os
+import re
+
+# section headers, as recognized by ConfigParser
+_header = re.compile(rb'^\[([^\]\r\n]+)\][ \t]*\r?$', re.MULTILINE)
+
+# indexes built in this process, by path
+_indexes = {}
+
+class MergeConfIndex:
+  """
+  Index of the byte range of each section in a configuration file, so that
+  individual sections can be read without reading or parsing the rest of the
+  file.  The file is read through `mmap`.
+
+  Indexes are cached in memory and optionally in a file alongside the
+  configuration file, and are rebuilt if the configuration file's size,
+  modification time or inode change.
+  """
+
+  def __init__(self, path, key, ranges):
+    self._path = path
+    self._key = key
+    self._ranges = ranges
+
+  @staticmethod
+  def _stat(path):
+    st = os.stat(path)
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+  @classmethod
+  def for_file(cls, path, persist=False):
+    """
+    Return the index for the given configuration file, building it if there
+    is no index for the file as it is now.
+
+    Args:
+      path (str): Path to the configuration file.
+      persist (boolean): Whether to also cache the index in a file named as
+        the configuration file with `.idx` appended.
+
+    Returns:
+      MergeConfIndex object.
+    """
+    key = cls._stat(path)
+    index = _indexes.get(path)
+    if index is not None and index._key == key:
+      return index
+
+    idxfile = f"{path}.idx"
+    if persist:
+      try:
+        with open(idxfile) as f:
+          data = json.load(f)
+        if data['key'] == key:
+          ranges = {}
+          for name, start, end in data['sections']:
+            ranges.setdefault(name, []).append((start, end))
+          index = cls(path, key, ranges)
+      except (OSError, ValueError, KeyError):
+        index = None
+
+    if index is None or index._key != key:
+      index = cls(path, key, cls._scan(path, key[1]))
+      if persist:
+        try:
+          with open(idxfile, 'w') as f:
+            json.dump({'key': key, 'sections': [
+              [name, start, end]
+              for name, ranges in index._ranges.items()
+              for start, end in ranges
+            ]}, f)
+        except OSError as e:
+          logging.debug("Unable to write index %s: %s", idxfile, e)
+
+    _indexes[path] = index
+    return index
+
+  @staticmethod
+  def _scan(path, size):
+    """
+    Find the byte range of each section.  Anything prior to the first section
+    header is given the name None.
+    """
+    ranges = {}
+    if not size:
+      return ranges
+    with open(path, 'rb') as f, \
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+      name, start = None, 0
+      for match in _header.finditer(m):
+        if match.start() > start or name is not None:
+          ranges.setdefault(name, []).append((start, match.start()))
+        name, start = match.group(1).decode().strip(), match.start()
+      ranges.setdefault(name, []).append((start, size))
+    return ranges
+
+  @property
+  def sections(self):
+    """
+    Return list of sections in the file.
+    """
+    return [name for name in self._ranges if name is not None]
+
+  def read(self, names):
+    """
+    Read the given sections from the file, including their headers.
+
+    Args:
+      names: List of section names.  None refers to anything prior to the
+        first section header.
+
+    Returns:
+      String containing the sections in the order they appear in the file.
+      Sections not found in the file are ignored.
+    """
+    ranges = sorted(
+      r for name in names for r in self._ranges.get(name, ())
+    )
+    if not ranges:
+      return ''
+    with open(self._path, 'rb') as f, \
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+      return ''.join(m[start:end].decode() for start, end in ranges)
@@ -0,0 +1,207 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=protected-access
+import re
+from mergeconf import exceptions
+
+# `${section.item}` references, or `$$` for a literal dollar sign
+_reference = re.compile(r'\$(?:\{([^}]*)\}|\$)')
+
+def _text(item):
+  """
+  Return the item's value as substituted for a reference to it, formatted as
+  in configuration files and environment variables.
+  """
+  value = item.value
+  if value is None:
+    return ''
+  if isinstance(value, bool):
+    return 'true' if value else 'false'
+  return item._str()
+
+class MergeConfInterpolator:
+  """
+  Interpolation of references to other items in string values, such as
+  `${base}/logs` or `${paths.base}/logs`, across sections and regardless of
+  the source of the values.
+
+  Values containing references are compiled once into templates, and the
+  references form a dependency graph between items.  When items change, only
+  the items downstream of them are resolved again, in dependency order, with
+  the values of the items they refer to already resolved.
+  """
+
+  def __init__(self, conf):
+    self._conf = conf
+    self._raw = {}
+    self._templates = {}
+    self._dependents = {}
+    self._stale = True
+
+  @property
+  def stale(self):
+    """
+    Whether the configuration definition has changed since references were
+    last compiled.
+    """
+    return self._stale
+
+  def invalidate(self):
+    """
+    Note that the configuration definition has changed.
+    """
+    self._stale = True
+
+  def raw(self, item):
+    """
+    Return the uninterpolated value of the item, or None if its value does
+    not contain references.
+    """
+    return self._raw.get(item)
+
+  def _lookup(self, name, owner):
+    *sections, key = name.split('.')
+    ref = self._conf
+    for section in sections:
+      ref = ref._sections.get(section)
+      if ref is None:
+        break
+    item = ref._items.get(key) if ref is not None else None
+    if item is None:
+      raise exceptions.UndefinedReference(self._name(owner), name)
+    return item
+
+  @staticmethod
+  def _name(item):
+    trail = item._parent._trail() if item._parent is not None else []
+    return '.'.join(trail + [item.key])
+
+  def _compile(self, item, raw):
+    """
+    Compile the raw value into a template of literal strings and referenced
+    items.
+    """
+    template = []
+    pos = 0
+    for match in _reference.finditer(raw):
+      template.append(raw[pos:match.start()])
+      if match.group(1) is None:
+        template.append('$')
+      else:
+        template.append(self._lookup(match.group(1), item))
+      pos = match.end()
+    template.append(raw[pos:])
+    self._templates[item] = template
+    for ref in template:
+      if not isinstance(ref, str):
+        self._dependents.setdefault(ref, set()).add(item)
+
+  def _rebuild(self):
+    """
+    Compile every item whose value contains references.
+    """
+    raw = {}
+    for _, _, item in self._conf._walk([]):
+      value = self._raw.get(item, item.value)
+      if isinstance(value, str) and '$' in value:
+        raw[item] = value
+    self._raw = raw
+    self._templates = {}
+    self._dependents = {}
+    for item, value in raw.items():
+      self._compile(item, value)
+    self._stale = False
+
+  def _check_cycles(self):
+    """
+    Raise `CircularReference` if any items refer to themselves, directly or
+    indirectly.
+    """
+    visiting, done = [], set()
+
+    def visit(item):
+      if item in done:
+        return
+      if item in visiting:
+        cycle = visiting[visiting.index(item):] + [item]
+        raise exceptions.CircularReference([self._name(x) for x in cycle])
+      visiting.append(item)
+      for ref in self._templates.get(item, ()):
+        if not isinstance(ref, str):
+          visit(ref)
+      visiting.pop()
+      done.add(item)
+
+    for item in self._templates:
+      visit(item)
+
+  def update(self, changed):
+    """
+    Bring interpolated values up to date.
+
+    Args:
+      changed: Items whose values have been set by configuration sources
+        since the last update.
+
+    Raises:
+      UndefinedReference: if a value refers to an undefined item.
+      CircularReference: if references form a cycle.
+    """
+    if self._stale:
+      # values set by sources replace any previous raw values
+      for item in changed:
+        self._raw.pop(item, None)
+      self._rebuild()
+      self._check_cycles()
+      dirty = set(self._templates)
+    else:
+      dirty = set()
+      recompiled = False
+      for item in changed:
+        value = item.value
+        if item in self._templates:
+          for ref in self._templates.pop(item):
+            if not isinstance(ref, str):
+              self._dependents[ref].discard(item)
+          del self._raw[item]
+          recompiled = True
+        if isinstance(value, str) and '$' in value:
+          self._raw[item] = value
+          self._compile(item, value)
+          recompiled = True
+        dirty.add(item)
+      if recompiled:
+        self._check_cycles()
+
+    # everything downstream of the changes
+    pending = list(dirty)
+    while pending:
+      for dependent in self._dependents.get(pending.pop(), ()):
+        if dependent not in dirty:
+          dirty.add(dependent)
+          pending.append(dependent)
+
+    # resolve in dependency order
+    waiting = {}
+    ready = []
+    for item in dirty:
+      if item not in self._templates:
+        continue
+      count = sum(
+        1 for ref in set(self._templates[item])
+        if not isinstance(ref, str) and ref in dirty and ref in self._templates
+      )
+      if count:
+        waiting[item] = count
+      else:
+        ready.append(item)
+    while ready:
+      item = ready.pop()
+      item.value = ''.join(
+        x if isinstance(x, str) else _text(x) for x in self._templates[item]
+      )
+      for dependent in self._dependents.get(item, ()):
+        if dependent in waiting:
+          waiting[dependent] -= 1
+          if not waiting[dependent]:
+            del waiting[dependent]
+            ready.append(dependent)
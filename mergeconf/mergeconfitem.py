@@ -2,6 +2,7 @@
 # pylint: disable=W0621
 
 from mergeconf import exceptions
+from mergeconf.mergeconfhostlist import MergeConfHostlist
 
 # aliasing this allows the use of a parameter `type`, for which I can't find a
 # reasonable replacement (like `klass` for `class`)
@@ -12,39 +13,61 @@ class MergeConfItem:
   Basic configuration item and base class for more complex types.
   """
   def _set_value_appropriately(self, value):
-    if value is None:
+    # values already of the right type (such as those loaded from JSON) are
+    # taken as-is without coercion
+    if value is None or builtin_type(value) is self._type:
       self._value = value
     elif self._type == bool:
-      if isinstance(value, bool):
-        self._value = value
-      else:
+      if isinstance(value, str):
         self._value = value.lower() in ['true', 'yes', '1']
+      else:
+        # including numbers, such as from a database
+        self._value = bool(value)
+    elif self._type == MergeConfHostlist and not isinstance(value, str):
+      self._value = MergeConfHostlist(str(value))
     else:
       self._value = self._type(value)
 
+  @staticmethod
+  def _supports(type):
+    """
+    Whether this class handles items of the given type.
+    """
+    return type in [bool, int, float, str, MergeConfHostlist]
+
   def __init__(self, key, value=None, type=None, mandatory=False, cli=False,
-      description=None):
+      description=None, min=None, max=None, choices=None, pattern=None,
+      check=None, depends=None):
     """
     Create a configuration item.
 
     Arguments:
       key: Configuration item's key.
       value: Current value
-      type: Item data type.  Must be one of bool, int, float or str.  If not
-        specified, will be autodetected.
+      type: Item data type.  Must be one of bool, int, float, str or
+        MergeConfHostlist.  If not specified, will be autodetected.
       mandatory: Item must have configured value for configuration to be valid.
       cli: Include item in command-line argument parsing.
       description (str): Short descriptive text that may appear in usage text
         or sample configurations
+      min: Smallest valid value, if any.
+      max: Largest valid value, if any.
+      choices: Collection of valid values, if restricted.
+      pattern (str): Regular expression the item's value, as a string, must
+        match in full.
+      check: Callable taking the item's value followed by the values of any
+        items named in `depends`, and returning True if the value is valid.
+      depends: List of fully qualified names, in section-dot-item syntax, of
+        items whose values are passed to `check`.
     """
-    if type and type not in [bool, int, float, str]:
+    if type and not self._supports(type):
       raise exceptions.UnsupportedType(type)
     if not type:
       if value is None:
         type = str
       else:
         type = builtin_type(value)
-        if type not in [bool, int, float, str]:
+        if not MergeConfItem._supports(type):
           type = str
 
     self._key = key
@@ -52,8 +75,23 @@ class MergeConfItem:
     self._mandatory = mandatory
     self._cli = cli
     self._description = description
+    self._min = min
+    self._max = max
+    self._choices = choices
+    self._pattern = pattern
+    self._check = check
+    self._depends = tuple(depends or ())
+
+    # incremented whenever the value changes, so that interested parties can
+    # cheaply tell whether it has changed since they last looked
+    self._version = 0
+
+    # section containing this item, notified of changes to the value
+    self._parent = None
+    self._digest = None
 
     self._set_value_appropriately(value)
+    self._default = self._value
 
   @property
   def key(self):
@@ -65,7 +103,13 @@ class MergeConfItem:
 
   @value.setter
   def value(self, value):
+    old = self._value
     self._set_value_appropriately(value)
+    if self._value != old:
+      self._version += 1
+      self._digest = None
+      if self._parent is not None:
+        self._parent._changed(self, old)
 
   @property
   def type(self):
@@ -82,3 +126,79 @@ class MergeConfItem:
   @property
   def description(self):
     return self._description
+
+  def _typename(self):
+    """
+    Return the name of the item's type, as shown in sample configurations.
+    """
+    return self._type.__name__
+
+  def _str(self):
+    """
+    Return the value as it would be written in a configuration file or
+    environment variable.
+    """
+    return str(self._value)
+
+  def _canonical(self):
+    """
+    Return a string representing the value unambiguously, from which the
+    item's hash is calculated.
+    """
+    return repr(self._value)
+
+  def _copy(self):
+    """
+    Return a copy of this item with its default value and no parent.
+    """
+    import copy
+    item = copy.copy(self)
+    item._value = self._default
+    item._version = 0
+    item._parent = None
+    item._digest = None
+    return item
+
+  def _content_digest(self):
+    """
+    Return a hash of the item's key and value, stable across processes.
+    """
+    if self._digest is None:
+      import hashlib
+      self._digest = hashlib.blake2b(
+        f"{self._key}={self._canonical()}".encode(), digest_size=16
+      ).digest()
+    return self._digest
+
+  @property
+  def min(self):
+    return self._min
+
+  @property
+  def max(self):
+    return self._max
+
+  @property
+  def choices(self):
+    return self._choices
+
+  @property
+  def pattern(self):
+    return self._pattern
+
+  @property
+  def check(self):
+    return self._check
+
+  @property
+  def depends(self):
+    return self._depends
+
+  @property
+  def constrained(self):
+    """
+    Whether the item has any validation beyond being mandatory.
+    """
+    return self._min is not None or self._max is not None \
+      or self._choices is not None or self._pattern is not None \
+      or self._check is not None
@@ -0,0 +1,86 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=W0621
+from array import array
+from mergeconf.mergeconfitem import MergeConfItem
+
+# `array` type codes for the supported element types
+_typecodes = {
+  int: 'q',
+  float: 'd',
+}
+
+class MergeConfListItem(MergeConfItem):
+  """
+  Configuration item holding a list of numbers, declared with a type such as
+  `list[int]` or `typing.List[float]`.
+
+  The list is parsed once, when the value is set, into compact `array`
+  storage, and read as a read-only `memoryview` of it, so readers share the
+  storage rather than each getting a new list.  In configuration files,
+  environment variables and command-line arguments the list is written with
+  elements separated by commas, for example `8080, 8081, 8082`.
+
+  Constraints apply to each element: `min` and `max` to the smallest and
+  largest elements and `choices` to every element.
+  """
+
+  @staticmethod
+  def _supports(type):
+    origin = getattr(type, '__origin__', None)
+    # TODO(3.7): `typing.List[int].__origin__` is `typing.List` in 3.6, and
+    # `list` from 3.7
+    origin = getattr(origin, '__extra__', origin)
+    return origin is list \
+      and len(getattr(type, '__args__', None) or ()) == 1 \
+      and type.__args__[0] in _typecodes
+
+  def __init__(self, key, value=None, type=None, **kwargs):
+    """
+    Create a list configuration item.  Arguments are as for `MergeConfItem`,
+    with `type` required.
+    """
+    self._element = type.__args__[0] if self._supports(type) else None
+    self._typecode = _typecodes.get(self._element)
+    super().__init__(key, value, type=type, **kwargs)
+
+  def _set_value_appropriately(self, value):
+    if value is None:
+      self._value = None
+      return
+    if isinstance(value, memoryview) and value.readonly \
+        and value.format == self._typecode:
+      # already parsed, such as a default or a value from another item
+      self._value = value
+      return
+    if isinstance(value, (int, float)):
+      # a single number, such as from a database
+      value = (value,)
+    elif isinstance(value, str):
+      # `array` consumes the elements in a single call, with no Python-level
+      # loop per element
+      value = value.strip()
+      value = map(self._element, value.split(',')) if value else ()
+    # TODO(3.8): use `memoryview(array(...)).toreadonly()` rather than a view
+    # of an immutable copy
+    self._value = memoryview(
+      array(self._typecode, value).tobytes()).cast(self._typecode)
+
+  @property
+  def element(self):
+    """
+    Type of the list's elements.
+    """
+    return self._element
+
+  def _typename(self):
+    return f"list[{self._element.__name__}]"
+
+  def _str(self):
+    if self._value is None:
+      return super()._str()
+    return ', '.join(str(x) for x in self._value.tolist())
+
+  def _canonical(self):
+    if self._value is None:
+      return super()._canonical()
+    return repr(self._value.tolist())
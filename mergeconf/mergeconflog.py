@@ -0,0 +1,18 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=global-statement
+"""
+Access to `logging`, which is imported when first used rather than with the
+package, as most processes never log anything through it.
+"""
+
+_logging = None
+
+def log():
+  """
+  Return the `logging` module, importing it on first use.
+  """
+  global _logging
+  if _logging is None:
+    import logging
+    _logging = logging
+  return _logging
@@ -0,0 +1,87 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=protected-access
+"""
+Process-wide registry of merged configurations, so that libraries sharing a
+configuration within an application each get the same merged configuration
+without declaring, reading and merging it again.
+"""
+import threading
+from mergeconf.mergeconf import MergeConf
+
+# guards the registry itself; each entry has its own lock held while loading
+_lock = threading.Lock()
+_entries = {}
+
+class _Entry:
+  """
+  Registry entry, loaded at most once.
+  """
+  def __init__(self, codename):
+    self.codename = codename
+    self.lock = threading.Lock()
+    self.conf = None
+
+def _fingerprint(schema):
+  """
+  Return a hash of the schema, or of other arguments which may not be
+  hashable.  Callables such as checks are identified by object, so the hash
+  is only meaningful within the process.
+  """
+  import hashlib
+  return hashlib.blake2b(repr(schema).encode(), digest_size=16).hexdigest()
+
+def get_or_load(codename, files=None, schema=None, **kwargs):
+  """
+  Return the merged configuration for the given codename, schema and
+  configuration files, creating and merging it if this has not already been
+  done in this process.  Concurrent callers asking for the same configuration
+  wait for a single load.
+
+  Args:
+    codename (str): As for `MergeConf()`.
+    files (str or list): As for `MergeConf()`.
+    schema: Definition of the configuration, as for `MergeConf.add_many()`.
+    kwargs: Other arguments to `MergeConf()`.
+
+  Returns:
+    Merged MergeConf object, shared with other callers.  If loading fails the
+    exception is raised and the next caller tries again.
+  """
+  if schema is not None and not isinstance(schema, dict):
+    schema = list(schema)
+  if files and not isinstance(files, (list, tuple)):
+    files = (files,)
+  key = (codename, _fingerprint(schema), tuple(files or ()),
+    _fingerprint(sorted(kwargs.items())))
+
+  with _lock:
+    entry = _entries.get(key)
+    if entry is None:
+      entry = _entries[key] = _Entry(codename)
+
+  conf = entry.conf
+  if conf is None:
+    with entry.lock:
+      conf = entry.conf
+      if conf is None:
+        conf = MergeConf.from_schema(codename, schema or {}, files=files,
+          **kwargs)
+        conf.merge()
+        entry.conf = conf
+  return conf
+
+def invalidate(codename=None):
+  """
+  Discard registered configurations, so that they are loaded again when next
+  requested.  Configurations already returned are unaffected.
+
+  Args:
+    codename (str): Codename of configurations to discard, or None to
+      discard all.
+  """
+  with _lock:
+    for key in [
+      key for key, entry in _entries.items()
+      if codename is None or entry.codename == codename
+    ]:
+      del _entries[key]
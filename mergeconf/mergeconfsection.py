@@ -1,33 +1,61 @@
 # vi: set softtabstop=2 ts=2 sw=2 expandtab:
 # pylint:
 
+from mergeconf import exceptions
 from mergeconf.mergeconfitem import MergeConfItem
+from mergeconf.mergeconflistitem import MergeConfListItem
+from mergeconf.mergeconflog import log
+from mergeconf.mergeconfsnapshot import MergeConfSnapshot
+
+def _new_item(key, value=None, type=None, **kwargs):
+  """
+  Create a configuration item of the class handling the given type.
+  """
+  if type is not None and MergeConfListItem._supports(type):
+    return MergeConfListItem(key, value, type=type, **kwargs)
+  return MergeConfItem(key, value, type=type, **kwargs)
+
+# arguments to `add()` which may appear in an item's specification for
+# `add_many()`
+_item_args = frozenset([
+  'value', 'type', 'mandatory', 'cli', 'description', 'min', 'max', 'choices',
+  'pattern', 'check', 'depends',
+])
 
 class MergeConfSection():
-  def __init__(self, name, map=None):
+  def __init__(self, name, map=None, parent=None):
     self._name = name
+    self._parent = parent
     self._items = {}
     self._sections = {}
+    self._digest = None
+    self._order = None
+
+    # file backing a lazily loaded section, and whether it has been loaded
+    self._file = None
+    self._index = False
+    self._loaded = True
 
     if map:
       for key, value in map.items():
         if isinstance(value, dict):
-          self._sections[key] = MergeConfSection(key, map=value)
+          self._sections[key] = MergeConfSection(key, map=value, parent=self)
         else:
           self._items[key] = MergeConfItem(key, value)
+          self._items[key]._parent = self
 
   def __getitem__(self, key):
     if key in self._items:
       return self._items[key].value
     if key in self._sections:
-      return self._sections[key]
+      return self._sections[key]._ensure_loaded()
     raise KeyError
 
   def __getattr__(self, attr):
     if attr in self._items:
       return self._items[attr].value
     if attr in self._sections:
-      return self._sections[attr]
+      return self._sections[attr]._ensure_loaded()
     raise AttributeError
 
   def __iter__(self):
@@ -69,6 +97,7 @@ class MergeConfSection():
     # } | {
     #   name: section.to_dict() for name, section in self._sections.items()
     # }
+    self._ensure_loaded()
     d = { key: item.value for key, item in self._items.items() }
     d.update(
       { name: section.to_dict() for name, section in self._sections.items() }
@@ -83,40 +112,298 @@ class MergeConfSection():
     return self._sections.keys()
 
   def add(self, key, value=None, type=None, mandatory=False, cli=False,
-      description=None):
+      description=None, min=None, max=None, choices=None, pattern=None,
+      check=None, depends=None):
     """
     Add a configuration item.
 
     Args:
       key (str): Name of configuration item
       value (whatever): Default value, None by default
-      type (type): Type of value
+      type (type): Type of value: bool, int, float, str, MergeConfHostlist,
+        or a list of int or float given as `list[int]` or `typing.List[int]`
       mandatory (boolean): Whether item is mandatory or not, defaults to
         False.
       cli (boolean): Whether item should be included in command-line arguments
       description (str): Short descriptive text that may appear in usage text
         or sample configurations
-
-    Notes: Type detection is attempted if not specified.
+      min: Smallest valid value
+      max: Largest valid value
+      choices (list): Valid values
+      pattern (str): Regular expression the value must match in full
+      check (callable): Predicate taking the value followed by the values of
+        the items listed in `depends`, returning True if the value is valid
+      depends (list): Items, in section-dot-item syntax, passed to `check`
+
+    Notes: Type detection is attempted if not specified.  Constraints are
+      checked by `validate()` and are not applied to undefined values.
     """
-    item = MergeConfItem(key, value, type=type, mandatory=mandatory,
-      cli=cli, description=description)
+    item = _new_item(key, value, type=type, mandatory=mandatory,
+      cli=cli, description=description, min=min, max=max, choices=choices,
+      pattern=pattern, check=check, depends=depends)
 
     default = self._items.get(item.key, None)
     if default and not item.value:
       item.value = default.value
+    item._default = item.value
+    item._parent = self
     self._items[item.key] = item
+    self._schema_changed()
+
+  @staticmethod
+  def _build_item(key, spec):
+    """
+    Create an item from its specification as given to `add_many()`.
+    """
+    if spec is None:
+      return MergeConfItem(key)
+    if isinstance(spec, dict):
+      return _new_item(key, **spec)
+    if isinstance(spec, type) or MergeConfListItem._supports(spec):
+      return _new_item(key, type=spec)
+    return MergeConfItem(key, spec)
+
+  def _build_items(self, spec, trail, groups):
+    """
+    Create the items in a nested dictionary specification, appending a tuple
+    of the section trail and list of items for each section to `groups`.
+    """
+    items = []
+    groups.append((trail, items))
+    for name, value in spec.items():
+      if isinstance(value, dict) \
+          and not (value and _item_args.issuperset(value)):
+        self._build_items(value, trail + (name,), groups)
+      else:
+        items.append(self._build_item(name, value))
+
+  def add_many(self, spec):
+    """
+    Add many configuration items and sections at once.  This is equivalent to
+    calling `add()` and `add_section()` for each, but faster for large
+    configuration definitions, as the definition is only rebuilt once.
 
-  def add_section(self, name):
+    Args:
+      spec: Either a dictionary of item and section names to their
+        specifications, or an iterable of tuples of a fully qualified item name,
+        in section-dot-item syntax, and the item's specification.  An item's
+        specification is a dictionary of arguments to `add()`, a type, a
+        default value, or None.  In a dictionary, sections are given as nested
+        dictionaries: a dictionary is taken as an item's specification if it
+        is not empty and all of its keys are arguments to `add()`.
+
+    Notes: The whole specification is checked before anything is added, so
+      that an invalid specification leaves the configuration unchanged.
+    """
+    # create every item before changing anything
+    groups = []
+    if isinstance(spec, dict):
+      self._build_items(spec, (), groups)
+    else:
+      grouped = {}
+      for name, value in spec:
+        *trail, key = name.split('.')
+        items = grouped.get(tuple(trail))
+        if items is None:
+          items = grouped[tuple(trail)] = []
+        items.append(self._build_item(key, value))
+      groups = grouped.items()
+
+    for trail, items in groups:
+      section = self
+      for name in trail:
+        subsection = section._sections.get(name)
+        if subsection is None:
+          subsection = MergeConfSection(name, parent=section)
+          section._sections[name] = subsection
+        section = subsection
+        section._digest = None
+        section._order = None
+
+      existing = section._items
+      for item in items:
+        default = existing.get(item._key)
+        if default is not None and not item._value:
+          item.value = default.value
+        item._default = item._value
+        item._parent = section
+        existing[item._key] = item
+
+    # with the definition complete, anything derived from it is rebuilt once
+    self._schema_changed()
+
+  def add_section(self, name, file=None, index=False):
     """
     Add a subsection to this section and return its object.
+
+    Args:
+      name (str): Name of the section
+      file (str): Path to a configuration file backing the section.  If
+        given, the section is loaded lazily: the file is only read and merged
+        when the section is first accessed, and until then the section is not
+        included in validation or other operations across the configuration.
+        Items defined prior to any section header, or under a header with the
+        section's name, belong to the section.  Values in the environment or
+        command-line arguments still take precedence.
+      index (boolean): If true, `file` is shared with other sections and only
+        the region under a header with the section's name is read, located
+        through an index of the byte range of each section in the file.
     """
-    if name in self._sections:
-      return self._sections[name]
-    section = MergeConfSection(name)
-    self._sections[name] = section
+    section = self._sections.get(name)
+    if section is None:
+      section = MergeConfSection(name, parent=self)
+      self._sections[name] = section
+    elif file is None or (file, index) == (section._file, section._index):
+      # nothing about the definition changes
+      return section
+    if file is not None:
+      section._file = file
+      section._index = index
+      section._loaded = False
+    self._schema_changed()
     return section
 
+  def _root(self):
+    """
+    Return the top-level configuration containing this section.
+    """
+    return self if self._parent is None else self._parent._root()
+
+  def _ensure_loaded(self, check=True):
+    """
+    Load a lazily loaded section if it has not already been loaded.
+
+    Args:
+      check: As for `MergeConf._load_section()`.
+
+    Returns:
+      This section.
+    """
+    if not self._loaded:
+      self._root()._load_section(self, check)
+    return self
+
+  def _load_all(self):
+    """
+    Load this section and any lazily loaded subsections not already loaded.
+    """
+    self._ensure_loaded()
+    for section in self._sections.values():
+      section._load_all()
+
+  def _copy_definition(self, target):
+    """
+    Copy the items and subsections of this section into another, with items
+    set to their default values.
+    """
+    for key, item in self._items.items():
+      item = item._copy()
+      item._parent = target
+      target._items[key] = item
+    for name, section in self._sections.items():
+      section._copy_definition(
+        target.add_section(name, file=section._file, index=section._index))
+
+  def _freeze(self):
+    """
+    Return an immutable snapshot of the values in this section and its
+    subsections.  Sections not yet loaded are loaded and frozen when first
+    accessed in the snapshot.
+    """
+    return MergeConfSnapshot(
+      { key: item.value for key, item in self._items.items() },
+      {
+        name: section._freeze() if section._loaded
+          else (lambda section=section: section._ensure_loaded()._freeze())
+        for name, section in self._sections.items()
+      }
+    )
+
+  def _schema_changed(self):
+    """
+    Called when items or sections are added to this section or any of its
+    subsections, so that anything derived from the configuration definition
+    can be rebuilt.
+    """
+    self._digest = None
+    self._order = None
+    if self._parent is not None:
+      self._parent._schema_changed()
+
+  def _changed(self, item, old):
+    """
+    Called when the value of an item in this section or any of its subsections
+    changes.
+
+    Args:
+      item: The MergeConfItem whose value changed.
+      old: The item's previous value.
+    """
+    self._digest = None
+    if self._parent is not None:
+      self._parent._changed(item, old)
+
+  def _trail(self):
+    """
+    Return the list of section names leading from the top of the
+    configuration to this section.
+    """
+    if self._parent is None:
+      return []
+    return self._parent._trail() + [self._name]
+
+  def _content_digest(self):
+    """
+    Return a hash of the contents of this section and its subsections, stable
+    across processes and independent of the order in which items were added.
+    The hash is cached and recalculated only along the path to changed items.
+    """
+    if self._digest is None:
+      # sort order only changes with the configuration definition
+      if self._order is None:
+        self._order = (sorted(self._items), sorted(self._sections))
+      keys, names = self._order
+      import hashlib
+      h = hashlib.blake2b(digest_size=16)
+      for key in keys:
+        h.update(self._items[key]._content_digest())
+      for name in names:
+        h.update(f"[{name}]".encode())
+        h.update(self._sections[name]._content_digest())
+      self._digest = h.digest()
+    return self._digest
+
+  def _diff(self, other, sections, added, removed, changed):
+    """
+    Compare this section with another, skipping any subsections with the same
+    digest, and record differences in the given dictionaries.
+    """
+    if self._content_digest() == other._content_digest():
+      return
+    prefix = '.'.join(sections) + '.' if sections else ''
+
+    for key, item in self._items.items():
+      theirs = other._items.get(key)
+      if theirs is None:
+        removed[f"{prefix}{key}"] = item.value
+      elif item._content_digest() != theirs._content_digest():
+        changed[f"{prefix}{key}"] = (item.value, theirs.value)
+    for key, item in other._items.items():
+      if key not in self._items:
+        added[f"{prefix}{key}"] = item.value
+
+    for name, section in self._sections.items():
+      theirs = other._sections.get(name)
+      if theirs is None:
+        for trail, key, item in section._walk(sections + [name]):
+          removed[f"{'.'.join(trail)}.{key}"] = item.value
+      else:
+        section._diff(theirs, sections + [name], added, removed, changed)
+    for name, section in other._sections.items():
+      if name not in self._sections:
+        for trail, key, item in section._walk(sections + [name]):
+          added[f"{'.'.join(trail)}.{key}"] = item.value
+
   def missing_mandatory(self):
     """
     Check that each mandatory item in this section and subsections has a
@@ -155,31 +442,138 @@ class MergeConfSection():
       if el:
         results.append(fn(sections, key, item))
 
-    # descend into subsections
+    # descend into subsections, other than those not yet loaded
     for name, section in self._sections.items():
-      results.extend(section._map(fn, sections + [name]))
+      if section._loaded:
+        results.extend(section._map(fn, sections + [name]))
 
     return results
 
-  def _sample_config(self):
+  def _walk(self, sections, unloaded=False):
+    """
+    Generate every item in this section and its subsections.
+
+    Args:
+      sections: list of sections built as a trail of breadcrumbs during
+        recursion.
+      unloaded: whether to include sections not yet loaded.
+
+    Yields:
+      Tuples of (sections, name, MergeConfItem).
+    """
+    for key, item in self._items.items():
+      yield (sections, key, item)
+    for name, section in self._sections.items():
+      if unloaded or section._loaded:
+        yield from section._walk(sections + [name], unloaded)
+
+  def _merge_dict(self, data, sections, strict, missing):
+    """
+    Merge values from a nested dictionary into this section and its
+    subsections, checking mandatory items along the way so the schema is
+    walked only once.
+
+    Args:
+      data: Dictionary of item values and nested subsection dictionaries.
+      sections: list of sections built as a trail of breadcrumbs during
+        recursion.
+      strict: Whether unexpected sections or items raise an exception.
+      missing: List to which fully qualified names of mandatory items without
+        a defined value are appended.
+    """
+    prefix = '.'.join(sections) + '.' if sections else ''
 
-    sample = []
+    for key, item in self._items.items():
+      if key in data:
+        if isinstance(data[key], dict):
+          # an item given as a section
+          raise exceptions.UndefinedSection(f"{prefix}{key}")
+        item.value = data[key]
+      if item.mandatory and item.value is None:
+        missing.append(f"{prefix}{key}")
+
+    for name, section in self._sections.items():
+      if name not in data and not section._loaded:
+        # checked when loaded
+        continue
+      value = data.get(name, {})
+      if not isinstance(value, dict):
+        # a section given as an item
+        raise exceptions.UndefinedConfiguration('.'.join(sections) or None,
+          name)
+      # loaded first, so that its file does not overwrite these values later
+      section._ensure_loaded(check=False)._merge_dict(value, sections + [name],
+        strict, missing)
+
+    # anything left over is not part of the configuration definition
+    for key, value in data.items():
+      if key in self._items or key in self._sections:
+        continue
+      if isinstance(value, dict):
+        if strict:
+          raise exceptions.UndefinedSection(f"{prefix}{key}")
+        log().warning("Unexpected section in configuration: %s%s", prefix,
+          key)
+        self.add_section(key)._merge_dict(value, sections + [key], strict,
+          missing)
+      else:
+        if strict:
+          raise exceptions.UndefinedConfiguration('.'.join(sections) or None,
+            key)
+        log().warning("Unexpected configuration item in section %s: %s",
+          '.'.join(sections) or None, key)
+        self.add(key, value)
+
+  def _config_lines(self, escape=False):
+    """
+    Generate the lines of a configuration file setting every defined item in
+    this section and its subsections to its current value.
 
+    Args:
+      escape (boolean): Whether to escape `$` for interpolation.
+
+    Raises:
+      ValueError: if an item with a value is in a nested section, which the
+        file format cannot express.
+    """
     for name, item in self._items.items():
-      typestr = f"({item.type.__name__}) " if item.type is not None else ''
-      sample.append(f"# {typestr}{item.description or ''}")
+      if item.value is not None:
+        value = item._str()
+        if escape:
+          value = value.replace('$', '$$')
+        yield f"{name} = {value}"
+
+    for name, section in self._sections.items():
+      if not section._loaded:
+        continue
+      if self._parent is not None:
+        for trail, key, item in section._walk(self._trail() + [name]):
+          if item.value is not None:
+            raise ValueError(
+              f"Cannot render nested item {'.'.join(trail + [key])}")
+        continue
+      yield ""
+      yield f"[{name}]"
+      yield from section._config_lines(escape)
+
+  def _sample_config(self):
+    """
+    Generate the lines of a sample configuration for this section and its
+    subsections, each item's lines followed by an empty line.
+    """
+    for name, item in self._items.items():
+      typestr = f"({item._typename()}) " if item.type is not None else ''
+      yield f"# {typestr}{item.description or ''}"
 
       if item.value:
-        sample.append(f"#{name} = {item.value}")
+        yield f"#{name} = {item._str()}"
       elif item.mandatory:
-        sample.append(f"{name} =")
+        yield f"{name} ="
       else:
-        sample.append(f"#{name} =")
+        yield f"#{name} ="
 
-      sample.append("")
+      yield ""
 
     for name, section in self._sections.items():
-      sample.append(f"[{name}]")
-      sample.extend(section._sample_config())
-
-    return sample
+      yield f"[{name}]"
+      yield from section._sample_config()
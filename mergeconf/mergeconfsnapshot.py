@@ -0,0 +1,61 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+
+class MergeConfSnapshot:
+  """
+  Immutable view of the values of a configuration or section at a point in
+  time.  Values are read as with MergeConf, using attribute or index notation.
+  """
+
+  __slots__ = ('_items', '_sections')
+
+  def __init__(self, items, sections):
+    object.__setattr__(self, '_items', items)
+    object.__setattr__(self, '_sections', sections)
+
+  def _section(self, name):
+    section = self._sections[name]
+    if not isinstance(section, MergeConfSnapshot):
+      # lazily loaded section, frozen when first accessed
+      section = self._sections[name] = section()
+    return section
+
+  def __getitem__(self, key):
+    if key in self._items:
+      return self._items[key]
+    if key in self._sections:
+      return self._section(key)
+    raise KeyError
+
+  def __getattr__(self, attr):
+    if attr in self._items:
+      return self._items[attr]
+    if attr in self._sections:
+      return self._section(attr)
+    raise AttributeError
+
+  def __setattr__(self, attr, value):
+    raise AttributeError("Configuration snapshot is read-only")
+
+  def __iter__(self):
+    """
+    Support iterating through configuration items.
+    """
+    yield from self._items.items()
+
+  @property
+  def sections(self):
+    """
+    Return list of sections.
+    """
+    return self._sections.keys()
+
+  def to_dict(self):
+    """
+    Return dictionary representation of configuration or section.
+    """
+    d = dict(self._items)
+    d.update(
+      { name: self._section(name).to_dict() for name in self._sections }
+    )
+    return d
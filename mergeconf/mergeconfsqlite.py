@@ -0,0 +1,71 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+import os
+import pathlib
+import sqlite3
+from mergeconf import exceptions
+
+# rows read in this process, by database, table and scopes
+_rows = {}
+
+def _version(path):
+  """
+  Return a value which changes whenever the database is written: the file's
+  inode, size and modification time, the change counter in the database
+  header, and the size and modification time of any write-ahead log.
+  """
+  st = os.stat(path)
+  with open(path, 'rb') as f:
+    header = f.read(100)
+  version = [st.st_ino, st.st_size, st.st_mtime_ns, header[24:28]]
+  try:
+    wal = os.stat(f"{path}-wal")
+    version.extend([wal.st_size, wal.st_mtime_ns])
+  except FileNotFoundError:
+    pass
+  return version
+
+def read(path, table, scopes):
+  """
+  Read the configuration rows for the given scopes from a SQLite database.
+  Rows are cached, and the database is only queried again once it changes.
+
+  Args:
+    path (str): Path to the database.
+    table (str): Table with `scope`, `section`, `key` and `value` columns.
+    scopes (list): Scopes to read, from least to most important.
+
+  Returns:
+    List of (section, key, value) tuples, in order of the scopes given.
+
+  Raises:
+    MissingConfigurationFile: if the database does not exist.
+  """
+  if not table.isidentifier():
+    raise ValueError(f"Invalid table name: {table}")
+  try:
+    version = _version(path)
+  except FileNotFoundError:
+    # pylint: disable=raise-missing-from
+    raise exceptions.MissingConfigurationFile(path)
+
+  key = (path, table, tuple(scopes))
+  cached = _rows.get(key)
+  if cached is not None and cached[0] == version:
+    return cached[1]
+
+  uri = f"{pathlib.Path(path).absolute().as_uri()}?mode=ro"
+  connection = sqlite3.connect(uri, uri=True)
+  try:
+    cursor = connection.execute(
+      f"SELECT scope, section, key, value FROM {table} "
+      f"WHERE scope IN ({', '.join('?' * len(scopes))})", list(scopes))
+    by_scope = {}
+    for scope, section, name, value in cursor:
+      by_scope.setdefault(scope, []).append((section, name, value))
+  finally:
+    connection.close()
+  rows = [row for scope in scopes for row in by_scope.get(scope, ())]
+
+  _rows[key] = (version, rows)
+  return rows
@@ -0,0 +1,88 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+
+class MergeConfSubscriptions:
+  """
+  Index of subscribers to configuration changes by the pattern of fully
+  qualified item names they are interested in.  Patterns use shell-style
+  wildcards as with `fnmatch`.
+
+  Exact names and whole-section patterns such as `db.*` are the common cases
+  and are looked up directly for each changed item, so the cost of matching
+  does not grow with the number of subscribers.  Other patterns are matched
+  individually.
+  """
+
+  def __init__(self):
+    self._exact = {}
+    self._sections = {}
+    self._patterns = []
+
+  def __bool__(self):
+    return bool(self._exact or self._sections or self._patterns)
+
+  @staticmethod
+  def _classify(pattern):
+    if not any(c in pattern for c in '*?['):
+      return ('exact', pattern)
+    if pattern == '*':
+      return ('section', '')
+    if pattern.endswith('.*') and not any(c in pattern[:-2] for c in '*?['):
+      return ('section', pattern[:-2])
+    return ('pattern', pattern)
+
+  def add(self, pattern, callback):
+    kind, key = self._classify(pattern)
+    if kind == 'exact':
+      self._exact.setdefault(key, []).append(callback)
+    elif kind == 'section':
+      self._sections.setdefault(key, []).append(callback)
+    else:
+      import fnmatch
+      import re
+      regex = re.compile(fnmatch.translate(pattern))
+      self._patterns.append((pattern, regex, callback))
+
+  def remove(self, pattern, callback):
+    kind, key = self._classify(pattern)
+    if kind == 'pattern':
+      self._patterns = [
+        x for x in self._patterns if not (x[0] == pattern and x[2] == callback)
+      ]
+      return
+    index = self._exact if kind == 'exact' else self._sections
+    callbacks = index.get(key, [])
+    if callback in callbacks:
+      callbacks.remove(callback)
+    if not callbacks:
+      index.pop(key, None)
+
+  def dispatch(self, changes):
+    """
+    Call each subscriber interested in any of the given changes, once, with
+    the subset of changes it is interested in.
+
+    Args:
+      changes: Dictionary of fully qualified item names to tuples of old and
+        new values.
+    """
+    matched = {}
+    for key, change in changes.items():
+      callbacks = list(self._exact.get(key, ()))
+
+      # every section containing the item, starting with the whole
+      # configuration
+      callbacks.extend(self._sections.get('', ()))
+      trail = key.split('.')[:-1]
+      for i in range(1, len(trail) + 1):
+        callbacks.extend(self._sections.get('.'.join(trail[:i]), ()))
+
+      for _, regex, callback in self._patterns:
+        if regex.match(key):
+          callbacks.append(callback)
+
+      for callback in callbacks:
+        matched.setdefault(callback, {})[key] = change
+
+    for callback, subset in matched.items():
+      callback(subset)
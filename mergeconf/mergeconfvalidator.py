@@ -0,0 +1,179 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+import re
+from mergeconf import exceptions
+
+class MergeConfValidator:
+  """
+  Validation plan for a configuration.  The configuration definition is
+  walked once to build a flat list of rules for the items which are mandatory
+  or have constraints, with any dependencies on other items resolved.
+
+  Each rule remembers the versions and values of the items it looked at and
+  the result of its last evaluation, so that rules whose items have not
+  changed since are not evaluated again.
+  """
+
+  def __init__(self, conf):
+    """
+    Compile the validation plan.
+
+    Args:
+      conf: MergeConf object whose definition is compiled.
+
+    Raises:
+      UndefinedConfiguration: if a constraint depends on an item which is not
+        defined.
+    """
+    # lazily loaded sections holding dependencies are loaded, as are any
+    # sections their own items depend on
+    while True:
+      items = self._items(conf)
+      loaded = [
+        dependency for item in items.values() for dependency in item.depends
+        if dependency not in items and self._load(conf, dependency)
+      ]
+      if not loaded:
+        break
+
+    self._conf = conf
+    self._rules = []
+    for name, item in items.items():
+      if not (item.mandatory or item.constrained):
+        continue
+      depends = []
+      for dependency in item.depends:
+        if dependency not in items:
+          section, _, key = dependency.rpartition('.')
+          raise exceptions.UndefinedConfiguration(section or None, key)
+        depends.append(items[dependency])
+      pattern = re.compile(item.pattern) if item.pattern is not None else None
+      self._rules.append(_Rule(name, item, tuple(depends), pattern))
+
+  @staticmethod
+  def _items(conf):
+    items = {}
+    for sections, name, item in conf._walk([]):
+      items[f"{'.'.join(sections) + '.' if sections else ''}{name}"] = item
+    return items
+
+  @staticmethod
+  def _load(conf, dependency):
+    """
+    Load any lazily loaded sections containing the given item.
+
+    Returns:
+      Whether any section was loaded.
+    """
+    loaded = False
+    ref = conf
+    for section in dependency.split('.')[:-1]:
+      ref = ref._sections.get(section)
+      if ref is None:
+        break
+      if not ref._loaded:
+        ref._ensure_loaded(check=False)
+        loaded = True
+    return loaded
+
+  def run(self, conf=None):
+    """
+    Evaluate the plan.
+
+    Args:
+      conf: MergeConf object with the same definition as the one the plan was
+        compiled for, whose values are to be checked instead, such as the copy
+        merged by `reload()`.  Rules are only evaluated again for values which
+        differ from those last evaluated.
+
+    Returns:
+      Tuple of two lists: the fully qualified names of mandatory items without
+      a defined value, and descriptions of every constraint violation.
+    """
+    staged = None
+    if conf is not None and conf is not self._conf:
+      staged = self._items(conf)
+
+    missing = []
+    violations = []
+    for rule in self._rules:
+      if staged is None:
+        item, depends = rule.item, rule.depends
+        versions = (item._version,) + tuple(x._version for x in depends)
+        if versions != rule.versions:
+          rule.versions = versions
+          if not rule.reuse(item, depends):
+            rule.missing, rule.violations = rule.evaluate(item, depends)
+      else:
+        item = staged[rule.name]
+        depends = tuple(staged[x] for x in rule.item.depends)
+        if not rule.reuse(item, depends):
+          # versions are only meaningful for the compiled configuration's items
+          rule.versions = None
+          rule.missing, rule.violations = rule.evaluate(item, depends)
+      if rule.missing:
+        missing.append(rule.name)
+      violations.extend(rule.violations)
+    return (missing, violations)
+
+class _Rule:
+  """
+  Compiled validation for a single configuration item.
+  """
+  # pylint: disable=too-few-public-methods
+
+  __slots__ = ('name', 'item', 'depends', 'pattern', 'versions', 'values',
+    'missing', 'violations')
+
+  def __init__(self, name, item, depends, pattern):
+    self.name = name
+    self.item = item
+    self.depends = depends
+    self.pattern = pattern
+    self.versions = None
+    self.values = None
+    self.missing = False
+    self.violations = []
+
+  def reuse(self, item, depends):
+    """
+    Return whether the given items have the values last evaluated, so that the
+    result still applies, or otherwise remember their values.
+    """
+    values = (item.value,) + tuple(x.value for x in depends)
+    if self.values is not None and values == self.values:
+      return True
+    self.values = values
+    return False
+
+  def evaluate(self, item, depends):
+    value = item.value
+    if value is None:
+      return (item.mandatory, [])
+
+    violations = []
+    if isinstance(value, memoryview):
+      # constraints on lists apply to each element
+      elements = value.tolist()
+      lowest = min(elements, default=None)
+      highest = max(elements, default=None)
+      outside = [] if item.choices is None \
+        else [x for x in elements if x not in item.choices]
+    else:
+      lowest = highest = value
+      outside = [value] \
+        if item.choices is not None and value not in item.choices else []
+    if item.min is not None and lowest is not None and lowest < item.min:
+      violations.append(f"{self.name}: {lowest} is less than {item.min}")
+    if item.max is not None and highest is not None and highest > item.max:
+      violations.append(f"{self.name}: {highest} is greater than {item.max}")
+    if outside:
+      violations.append(f"{self.name}: {outside[0]} is not one of " \
+        f"{', '.join(str(x) for x in item.choices)}")
+    if self.pattern is not None and not self.pattern.fullmatch(item._str()):
+      violations.append(f"{self.name}: {value} does not match " \
+        f"'{item.pattern}'")
+    if item.check is not None and \
+        not item.check(value, *(x.value for x in depends)):
+      violations.append(f"{self.name}: {value} failed check")
+    return (False, violations)
@@ -0,0 +1,161 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=protected-access
+import mmap
+import os
+import tempfile
+from mergeconf.mergeconfindex import MergeConfIndex
+
+def _option(line):
+  """
+  Return the lowercased option name defined on a line, as ConfigParser would
+  read it, or None if the line does not define an option.
+  """
+  if not line[:1].strip() or line.lstrip()[:1] in (b'#', b';', b'['):
+    return None
+  name, sep, _ = line.partition(b'=')
+  return name.strip().lower() if sep else None
+
+def _lines(m, start, end):
+  """
+  Generate (start, end, line) for each line in the byte range.
+  """
+  pos = start
+  while pos < end:
+    stop = m.find(b'\n', pos, end)
+    stop = end if stop < 0 else stop + 1
+    yield (pos, stop, m[pos:stop])
+    pos = stop
+
+def _locate(m, ranges, key):
+  """
+  Find the definition of an option in a section's byte ranges.
+
+  Returns:
+    Tuple of the start and end of the definition, including any continuation
+    lines, and the end of the option name, or None if it is not defined.
+  """
+  for start, end in ranges:
+    found = None
+    for pos, stop, line in _lines(m, start, end):
+      if found is not None:
+        # continuation lines are indented and not blank
+        if line[:1] in (b' ', b'\t') and line.strip():
+          found[1] = stop
+          continue
+        break
+      if _option(line) == key:
+        found = [pos, stop, pos + line.index(b'=') + 1]
+    if found is not None:
+      return tuple(found)
+  return None
+
+def _end_of_content(m, ranges):
+  """
+  Return the offset just after the last non-blank line of a section.
+  """
+  start, end = ranges[-1]
+  last = start
+  for _, stop, line in _lines(m, start, end):
+    if line.strip():
+      last = stop
+  return last
+
+def _format(key, value, newline):
+  value = value.replace('\n', '\n\t')
+  return f"{key} = {value}{newline}".encode()
+
+def _umask():
+  """
+  Return the process's umask, which can only be read by setting it.
+  """
+  mask = os.umask(0o022)
+  os.umask(mask)
+  return mask
+
+def save(path, changes, main):
+  """
+  Write changed options to a configuration file, rewriting only the lines
+  defining them and copying the rest of the file unchanged, then replace the
+  file atomically.
+
+  Args:
+    path (str): Path to the configuration file.  It is created if it does
+      not exist.
+    changes: List of (section, key, value) tuples, with a section of None for
+      options defined before any section header, and a value of None to
+      comment out the option.  Values are strings as they should appear in
+      the file.
+    main (str): Name of the section header that may also be used for
+      options outside of any section.
+  """
+  try:
+    index = MergeConfIndex.for_file(path)
+    size = os.path.getsize(path)
+  except FileNotFoundError:
+    index, size = None, 0
+
+  with open(path, 'rb') if size else open(os.devnull, 'rb') as f, \
+      (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size
+        else memoryview(b'')) as m:
+    newline = '\r\n' if size and m.find(b'\r\n', 0, 4096) >= 0 else '\n'
+    edits = []
+    appended = {}
+    for section, key, value in changes:
+      ranges = index._ranges.get(section, []) if index else []
+      if section is None and index and main in index._ranges:
+        ranges = ranges + index._ranges[main]
+      location = _locate(m, ranges, key.encode()) if ranges else None
+      if location is not None:
+        start, end, name_end = location
+        if value is None:
+          # including any continuation lines, which would otherwise be read
+          # as part of the option above
+          edits.extend((pos, pos, b'#') for pos, _, _ in _lines(m, start, end))
+        else:
+          text = value.replace('\n', '\n\t')
+          edits.append((name_end, end, f" {text}{newline}".encode()))
+      elif value is None:
+        continue
+      elif ranges:
+        pos = _end_of_content(m, ranges)
+        data = _format(key, value, newline)
+        if pos and m[pos - 1:pos] != b'\n':
+          data = newline.encode() + data
+        edits.append((pos, pos, data))
+      elif section is None:
+        # before the first section header
+        edits.append((0, 0, _format(key, value, newline)))
+      else:
+        appended.setdefault(section, []).append(_format(key, value, newline))
+
+    for section, lines in appended.items():
+      header = f"{newline}[{section}]{newline}".encode()
+      if size and not m[size - 1:size] == b'\n':
+        header = newline.encode() + header
+      edits.append((size, size, header + b''.join(lines)))
+
+    # unchanged regions are copied straight from the mapped file
+    edits.sort(key=lambda x: (x[0], x[1]))
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory,
+      prefix=f".{os.path.basename(path)}.")
+    try:
+      with os.fdopen(fd, 'wb') as out:
+        pos = 0
+        for start, end, data in edits:
+          out.write(m[pos:start])
+          out.write(data)
+          pos = max(pos, end)
+        out.write(m[pos:size])
+        out.flush()
+        os.fsync(out.fileno())
+      # temporary files are only readable by their owner
+      try:
+        mode = os.stat(path).st_mode & 0o7777
+      except FileNotFoundError:
+        mode = 0o666 & ~_umask()
+      os.chmod(tmp, mode)
+      os.replace(tmp, path)
+    except BaseException:
+      os.unlink(tmp)
+      raise
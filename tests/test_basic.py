@@ -1,5 +1,6 @@
 # vi: set softtabstop=2 ts=2 sw=2 expandtab:
-# pylint: disable=unused-import,singleton-comparison
+# pylint: disable=unused-import,singleton-comparison,protected-access
+import argparse
 import os
 import pytest
 from tests.fixtures import (
@@ -330,3 +331,52 @@ count =
 
 # (float) The ratio of thing to thang
 #ratio ="""
+
+def test_sample_config_streamed(config, tmp_path):
+  """
+  Tests the sample configuration may be generated line by line or written
+  directly to a file.
+  """
+  section3 = config.add_section('section3')
+  section3.add_section('empty')
+  expected = config.sample_config()
+  assert expected.endswith('#ratio =\n\n[section3]')
+  assert list(config.iter_sample_config()) == expected.split('\n')
+  path = tmp_path / 'sample.conf'
+  with open(path, 'w') as f:
+    config.write_sample_config(f)
+  assert path.read_text() == expected
+  assert mergeconf.MergeConf('test').sample_config() == ''
+
+def test_args_grouped(config, argparser):
+  """
+  Tests that arguments for sectioned items are grouped by section.
+  """
+  config.config_argparser(argparser)
+  titles = [group.title for group in argparser._action_groups]
+  assert titles[-2:] == ['section1', 'section2']
+  assert [x.dest for x in argparser._action_groups[-1]._group_actions] == \
+    ['section2_count', 'section2_ratio']
+
+def test_args_subcommands(config):
+  """
+  Tests that subcommands may include only some sections, and have their
+  arguments added only when used.
+  """
+  parser = argparse.ArgumentParser(prog=codename)
+  subparsers = parser.add_subparsers(dest='command')
+  shape = subparsers.add_parser('shape')
+  config.config_argparser(shape, sections=[None, 'section1'], lazy=True)
+  count = subparsers.add_parser('count')
+  config.config_argparser(count, sections=['section2'], lazy=True)
+  assert not shape._actions[1:]
+  assert not count._actions[1:]
+
+  args = parser.parse_args(['count', '--section2-count=12'])
+  assert not shape._actions[1:]
+  assert [x.dest for x in count._actions[1:]] == \
+    ['section2_count', 'section2_ratio']
+  config.merge(args)
+  assert config.section2.count == 12
+  assert config.shape == 'circle'
+  assert config.command == 'count'
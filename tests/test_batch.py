@@ -0,0 +1,125 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name,protected-access
+import os
+import pytest
+import mergeconf
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+  """
+  Create a merged base configuration and override files for some nodes.
+  """
+  monkeypatch.chdir(tmp_path)
+  (tmp_path / 'out').mkdir()
+  (tmp_path / 'base.conf').write_text(
+    "name = cluster\n[node]\nslots = 8\nqueue = batch\n")
+  overrides = {}
+  for i in range(20):
+    path = tmp_path / f"node{i}.conf"
+    path.write_text(f"[node]\nslots = {i}\n" if i % 2 else "[node]\n")
+    overrides[f"node{i}"] = str(path)
+  conf = mergeconf.MergeConf('test', files='base.conf', interpolate=True)
+  conf.add('name')
+  node = conf.add_section('node')
+  node.add('slots', type=int, max=32)
+  node.add('queue')
+  node.add('logs', value='/logs/${name}/${node.queue}')
+  conf.merge()
+  return (conf, overrides)
+
+@pytest.mark.parametrize('processes', [1, 3])
+def test_materialize(cluster, processes):
+  """
+  Tests each node's configuration is the base with its overrides.
+  """
+  conf, overrides = cluster
+  overrides['node3'] = [overrides['node3'], 'extra.conf']
+  with open('extra.conf', 'w') as f:
+    f.write("name = special\n")
+  fingerprint = conf.fingerprint()
+
+  result = conf.materialize(overrides, 'out', processes=processes)
+  assert result.nodes == 20
+  assert result.rate > 0
+  assert conf.fingerprint() == fingerprint
+  with open('out/node0.conf') as f:
+    assert f.read() == \
+      "name = cluster\n\n[node]\nslots = 8\nqueue = batch\n" \
+      "logs = /logs/cluster/batch\n"
+
+  for i in range(20):
+    rendered = mergeconf.MergeConf('test', strict=False)
+    rendered.merge_file(f"out/node{i}.conf")
+    assert rendered.node.slots == str(i if i % 2 else 8)
+    assert rendered.name == ('special' if i == 3 else 'cluster')
+    assert rendered.node.logs == f"/logs/{rendered.name}/batch"
+
+@pytest.mark.parametrize('processes', [1, 3])
+def test_materialize_invalid(cluster, processes):
+  """
+  Tests a node whose configuration is invalid is reported.
+  """
+  conf, overrides = cluster
+  with open(overrides['node5'], 'w') as f:
+    f.write("[node]\nslots = 99\n")
+  with pytest.raises(mergeconf.exceptions.InvalidConfiguration):
+    conf.materialize(overrides, 'out', processes=processes)
+
+def test_materialize_sections(cluster, tmp_path):
+  """
+  Tests lazily loaded sections are rendered, and nested sections, which
+  cannot be, are reported before anything is written.
+  """
+  conf, overrides = cluster
+  (tmp_path / 'queue.conf').write_text("[queue]\nname = fast\n")
+  conf.add_section('queue', file='queue.conf').add('name')
+  conf.materialize(overrides, 'out', processes=1)
+  with open('out/node1.conf') as f:
+    assert f.read().endswith("\n[queue]\nname = fast\n")
+
+  conf.node.add_section('gpu').add('count', value=2)
+  with pytest.raises(ValueError):
+    conf.materialize({'node20': overrides['node1']}, 'out', processes=1)
+  assert not (tmp_path / 'out' / 'node20.conf').exists()
+
+def test_materialize_concurrently(cluster):
+  """
+  Tests configurations materialized from different bases at the same time
+  each use their own base.
+  """
+  import threading
+  conf, overrides = cluster
+  other = conf._clone()
+  other.set('name', 'other')
+  errors = []
+  def run(base, directory):
+    try:
+      base.materialize(overrides, directory, processes=2)
+    except Exception as e: # pylint: disable=broad-except
+      errors.append(e)
+  os.mkdir('other')
+  threads = [
+    threading.Thread(target=run, args=(conf, 'out')),
+    threading.Thread(target=run, args=(other, 'other')),
+  ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert not errors
+  for i in range(20):
+    with open(f"out/node{i}.conf") as f:
+      assert f.readline() == "name = cluster\n"
+    with open(f"other/node{i}.conf") as f:
+      assert f.readline() == "name = other\n"
+
+def test_write_partial(tmp_path, monkeypatch):
+  """
+  Tests files are written in full when writes are cut short.
+  """
+  from mergeconf import mergeconfbatch
+  write = os.write
+  monkeypatch.setattr(mergeconfbatch.os, 'write',
+    lambda fd, data: write(fd, data[:3]))
+  mergeconfbatch._write(str(tmp_path / 'node.conf'), "name = cluster\n")
+  assert (tmp_path / 'node.conf').read_text() == "name = cluster\n"
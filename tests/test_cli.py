@@ -0,0 +1,123 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name
+import json
+import os
+import subprocess
+import sys
+import pytest
+from mergeconf import __main__ as cli
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+  """
+  Create a schema module and configuration file for the command-line tool.
+  """
+  (tmp_path / 'appschema.py').write_text(
+    "import typing\n"
+    "SCHEMA = {\n"
+    "  'name': None,\n"
+    "  'debug': bool,\n"
+    "  'db': {'host': {'mandatory': True}, 'port': int, 'user': None},\n"
+    "  'nodes': typing.List[int],\n"
+    "}\n")
+  (tmp_path / 'app.conf').write_text(
+    "name = it's mine\n"
+    "debug = true\n"
+    "nodes = 1, 2, 3\n"
+    "[db]\n"
+    "host = db1\n"
+    "port = 5432\n")
+  monkeypatch.syspath_prepend(str(tmp_path))
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.delenv('APP_CONFIG', raising=False)
+  return tmp_path
+
+def test_export(app, capsys):
+  """
+  Tests values are printed as export statements which a shell can evaluate.
+  """
+  assert cli.main(['app', '-s', 'appschema:SCHEMA', '-f', 'app.conf',
+    'name', 'db.port', 'debug', 'nodes', 'db.user']) == 0
+  output = capsys.readouterr().out
+  assert output.splitlines() == [
+    "export APP_NAME='it'\"'\"'s mine'",
+    "export APP_DB_PORT=5432",
+    "export APP_DEBUG=true",
+    "export APP_NODES='1, 2, 3'",
+    "unset APP_DB_USER",
+  ]
+  result = subprocess.run(['sh', '-c', f"{output}echo \"$APP_NAME\""],
+    stdout=subprocess.PIPE, check=True, universal_newlines=True)
+  assert result.stdout == "it's mine\n"
+
+def test_json(app, capsys, monkeypatch):
+  """
+  Tests values are printed as JSON, that the environment is merged, and
+  that errors are reported.
+  """
+  monkeypatch.setenv('APP_DB_PORT', '6543')
+  assert cli.main(['app', '-s', 'appschema:SCHEMA', '-f', 'app.conf',
+    '--json']) == 0
+  assert json.loads(capsys.readouterr().out) == {
+    'name': "it's mine", 'debug': True, 'nodes': [1, 2, 3],
+    'db.host': 'db1', 'db.port': 6543, 'db.user': None,
+  }
+
+  with pytest.raises(SystemExit) as e:
+    cli.main(['app', '-s', 'appschema:SCHEMA', '-f', 'app.conf', 'db.name'])
+  assert e.value.code == 1
+  assert 'db.name' in capsys.readouterr().err
+
+  with pytest.raises(SystemExit) as e:
+    cli.main(['app', '-s', 'appschema:SCHEMA', 'name'])
+  assert e.value.code == 1
+  assert 'db.host' in capsys.readouterr().err
+
+  monkeypatch.setenv('APP_DB_PORT', 'x')
+  with pytest.raises(SystemExit) as e:
+    cli.main(['app', '-s', 'appschema:SCHEMA', '-f', 'app.conf'])
+  assert e.value.code == 1
+  assert "'x'" in capsys.readouterr().err
+
+  monkeypatch.setenv('APP_DB_PORT', '1')
+  monkeypatch.setenv('APP_DB_USER', '${db.missing}')
+  with pytest.raises(SystemExit) as e:
+    cli.main(['app', '-s', 'appschema:SCHEMA', '-f', 'app.conf',
+      '--interpolate'])
+  assert e.value.code == 1
+  assert 'db.missing' in capsys.readouterr().err
+
+def test_cache(app, capsys, monkeypatch):
+  """
+  Tests merged values are reused from the cache until a source changes.
+  """
+  merges = []
+  merge = cli._merge
+  monkeypatch.setattr(cli, '_merge', lambda *x: merges.append(1) or merge(*x))
+  run = ['app', '-s', 'appschema:SCHEMA', '-f', 'app.conf', '--cache',
+    'app.cache', 'db.port']
+  cli.main(run)
+  cli.main(run)
+  assert len(merges) == 1
+  assert [x for x in os.listdir() if 'app.cache' in x] == ['app.cache']
+
+  monkeypatch.setenv('APP_DB_PORT', '1')
+  cli.main(run)
+  with open('app.conf', 'a') as f:
+    f.write("user = me\n")
+  cli.main(run + ['db.user'])
+  assert len(merges) == 3
+  assert capsys.readouterr().out.splitlines()[-2:] == [
+    "export APP_DB_PORT=1", "export APP_DB_USER=me",
+  ]
+
+def test_module(app):
+  """
+  Tests the tool runs as `python -m mergeconf` with a prefix.
+  """
+  env = dict(os.environ, APP_CONFIG='app.conf', PYTHONPATH=os.pathsep.join(
+    [str(app), os.path.dirname(os.path.dirname(cli.__file__))]))
+  result = subprocess.run([sys.executable, '-m', 'mergeconf', 'app', '-s',
+    'appschema:SCHEMA', '--prefix', '', 'db.host'], env=env,
+    stdout=subprocess.PIPE, check=True, universal_newlines=True)
+  assert result.stdout == "export DB_HOST=db1\n"
@@ -0,0 +1,185 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name
+import os
+import threading
+import time
+import pytest
+import mergeconf
+
+@pytest.fixture
+def dbconf():
+  """
+  Create a configuration whose values are read together.
+  """
+  conf = mergeconf.MergeConf('test')
+  db = conf.add_section('db')
+  db.add('host', value='h0')
+  db.add('port', value=0)
+  yield conf
+  for var in ('TEST_DB_HOST', 'TEST_DB_PORT'):
+    os.environ.pop(var, None)
+
+def test_snapshot_read_only(dbconf):
+  """
+  Tests snapshots provide the configuration values and cannot be modified.
+  """
+  snapshot = dbconf.snapshot()
+  assert snapshot.db.host == 'h0'
+  assert snapshot['db']['port'] == 0
+  assert snapshot.to_dict() == dbconf.to_dict()
+  with pytest.raises(AttributeError):
+    snapshot.db.host = 'elsewhere'
+  assert dbconf.snapshot() is snapshot
+
+def test_snapshot_after_merge(dbconf):
+  """
+  Tests a merge in place retires the published snapshot.
+  """
+  snapshot = dbconf.snapshot()
+  os.environ['TEST_DB_PORT'] = '12'
+  dbconf.merge()
+  assert snapshot.db.port == 0
+  assert dbconf.snapshot().db.port == 12
+
+def test_snapshot_after_unchanged_merge(dbconf):
+  """
+  Tests a merge which changes nothing keeps the published snapshot.
+  """
+  snapshot = dbconf.snapshot()
+  dbconf.merge()
+  assert dbconf.snapshot() is snapshot
+  os.environ['TEST_DB_PORT'] = '0'
+  dbconf.merge()
+  assert dbconf.snapshot() is snapshot
+
+def test_reload(dbconf):
+  """
+  Tests a reload starts from defaults and publishes a new snapshot.
+  """
+  os.environ['TEST_DB_HOST'] = 'h1'
+  dbconf.merge()
+  del os.environ['TEST_DB_HOST']
+  os.environ['TEST_DB_PORT'] = '1'
+  dbconf.reload()
+  assert dbconf.snapshot().db.host == 'h0'
+  assert dbconf.snapshot().db.port == 1
+  assert dbconf.db.host == 'h0'
+
+def test_reload_failure_leaves_configuration(dbconf):
+  """
+  Tests a reload failing validation does not modify anything.
+  """
+  dbconf.db.add('name', mandatory=True, value='db')
+  dbconf.db.add('user', mandatory=True)
+  os.environ['TEST_DB_PORT'] = '1'
+  with pytest.raises(mergeconf.exceptions.MissingConfiguration):
+    dbconf.reload()
+  assert dbconf.db.port == 0
+  assert dbconf.snapshot().db.port == 0
+
+def test_reload_stress(dbconf):
+  """
+  Tests readers never see values from different reloads while reloads run
+  continuously.
+  """
+  stop = threading.Event()
+  torn = []
+  reads = []
+
+  def reader():
+    count = 0
+    while not stop.is_set():
+      snapshot = dbconf.snapshot()
+      host, port = snapshot.db.host, snapshot.db.port
+      if host != f"h{port}":
+        torn.append((host, port))
+      count += 1
+    reads.append(count)
+
+  readers = [threading.Thread(target=reader) for _ in range(8)]
+  for thread in readers:
+    thread.start()
+
+  reloads = 0
+  deadline = time.time() + 0.5
+  while time.time() < deadline:
+    reloads += 1
+    os.environ['TEST_DB_HOST'] = f"h{reloads}"
+    os.environ['TEST_DB_PORT'] = str(reloads)
+    dbconf.reload()
+
+  stop.set()
+  for thread in readers:
+    thread.join()
+
+  assert not torn
+  assert reloads > 10
+  assert all(reads)
+  assert dbconf.snapshot().db.port == reloads
+
+@pytest.fixture
+def registry():
+  """
+  Start each test with an empty registry.
+  """
+  mergeconf.invalidate()
+  yield
+  mergeconf.invalidate()
+
+def test_registry(registry):
+  """
+  Tests the registry returns the same configuration for the same codename,
+  schema and files, and loads it again once invalidated.
+  """
+  schema = {
+    'shape': { 'mandatory': True },
+    'upsidedown': bool,
+    'section2': { 'count': int, 'ratio': float },
+  }
+  conf = mergeconf.get_or_load('test', 'tests/test1.conf', schema)
+  assert conf.shape == 'circle'
+  assert mergeconf.get_or_load('test', ['tests/test1.conf'], dict(schema)) \
+    is conf
+  assert mergeconf.get_or_load('test', 'tests/test1.conf',
+    { **schema, 'name': None }) is not conf
+
+  mergeconf.invalidate('other')
+  assert mergeconf.get_or_load('test', 'tests/test1.conf', schema) is conf
+  mergeconf.invalidate('test')
+  assert mergeconf.get_or_load('test', 'tests/test1.conf', schema) \
+    is not conf
+
+  # arguments which are not hashable
+  conf = mergeconf.get_or_load('test', 'tests/test1.conf', schema,
+    strict=False, map={'colour': 'black'})
+  assert conf.colour == 'black'
+  assert mergeconf.get_or_load('test', 'tests/test1.conf', schema,
+    map={'colour': 'black'}, strict=False) is conf
+  assert mergeconf.get_or_load('test', 'tests/test1.conf', schema,
+    strict=False, map={'colour': 'white'}) is not conf
+
+def test_registry_loads_once(registry, monkeypatch):
+  """
+  Tests concurrent callers share a single load.
+  """
+  merges = []
+  merge = mergeconf.MergeConf.merge
+  def slow_merge(self, *args):
+    merges.append(self)
+    time.sleep(0.05)
+    return merge(self, *args)
+  monkeypatch.setattr(mergeconf.MergeConf, 'merge', slow_merge)
+
+  results = []
+  threads = [
+    threading.Thread(target=lambda: results.append(
+      mergeconf.get_or_load('test', schema={ 'name': 'x' })))
+    for _ in range(8)
+  ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(merges) == 1
+  assert len(results) == 8
+  assert all(conf is merges[0] for conf in results)
@@ -0,0 +1,132 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name
+import argparse
+import typing
+import pytest
+import mergeconf
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+  """
+  Create a configuration whose values refer to each other.
+  """
+  monkeypatch.chdir(tmp_path)
+  conf = mergeconf.MergeConf('test', interpolate=True)
+  conf.add('base', value='/srv')
+  conf.add('cost', value='$$5')
+  logs = conf.add_section('logs')
+  logs.add('dir', value='${base}/logs', cli=True)
+  logs.add('file', value='${logs.dir}/app.log')
+  conf.add_section('data').add('dir', value='${base}/data')
+  return conf
+
+def test_defaults(paths):
+  """
+  Tests references in default values are resolved across sections.
+  """
+  paths.merge()
+  assert paths.logs.dir == '/srv/logs'
+  assert paths.logs.file == '/srv/logs/app.log'
+  assert paths.data.dir == '/srv/data'
+  assert paths.cost == '$5'
+
+def test_sources(paths, monkeypatch):
+  """
+  Tests references are followed whatever the source of each value.
+  """
+  with open('test.conf', 'w') as f:
+    f.write("base = /opt\n")
+  monkeypatch.setenv('TEST_DATA_DIR', '${logs.dir}/../data')
+  parser = argparse.ArgumentParser()
+  paths.config_argparser(parser)
+  paths.merge_file('test.conf')
+  paths.merge(parser.parse_args(['--logs-dir=${base}/log']))
+  assert paths.logs.file == '/opt/log/app.log'
+  assert paths.data.dir == '/opt/log/../data'
+
+  # environment remains in effect on repeated merge
+  paths.merge_file('test.conf')
+  paths.merge_environment()
+  assert paths.data.dir == '/opt/log/../data'
+
+def test_only_downstream_resolved(paths):
+  """
+  Tests only items downstream of a change are resolved again.
+  """
+  paths.merge()
+  changes = []
+  paths.subscribe('*', changes.append)
+  paths.logs._items['dir'].value = '/var/log'
+  paths.merge_environment()
+  assert changes == [{
+    'logs.dir': ('/srv/logs', '/var/log'),
+    'logs.file': ('/srv/logs/app.log', '/var/log/app.log'),
+  }]
+
+  changes.clear()
+  paths._items['base'].value = '/usr'
+  paths.merge_environment()
+  assert changes == [{
+    'base': ('/srv', '/usr'),
+    'data.dir': ('/srv/data', '/usr/data'),
+  }]
+
+def test_cycle(paths):
+  """
+  Tests circular references are detected.
+  """
+  paths.add('base', value='${logs.file}')
+  with pytest.raises(mergeconf.exceptions.CircularReference) as e:
+    paths.merge()
+  assert e.value.cycle == ['base', 'logs.file', 'logs.dir', 'base']
+
+def test_undefined_reference(paths):
+  """
+  Tests references to undefined items are caught.
+  """
+  paths.data.add('dir', value='${nope.dir}')
+  with pytest.raises(mergeconf.exceptions.UndefinedReference) as e:
+    paths.merge()
+  assert e.value.item == 'data.dir'
+  assert e.value.reference == 'nope.dir'
+
+def test_reload(paths, monkeypatch):
+  """
+  Tests references are kept across reloads.
+  """
+  paths.merge()
+  monkeypatch.setenv('TEST_BASE', '/home')
+  paths.reload()
+  assert paths.snapshot().logs.file == '/home/logs/app.log'
+  assert paths.logs.file == '/home/logs/app.log'
+  monkeypatch.setenv('TEST_BASE', '/tmp')
+  paths.merge_environment()
+  assert paths.logs.file == '/tmp/logs/app.log'
+
+def test_constraints(paths, monkeypatch):
+  """
+  Tests constraints are checked against interpolated values.
+  """
+  paths.add('logroot', value='${base}/logs', pattern=r'/.*')
+  paths.add('dataroot', value='${base}/data',
+    check=lambda x: x.startswith('/srv/'))
+  paths.merge()
+  assert paths.logroot == '/srv/logs'
+
+  monkeypatch.setenv('TEST_BASE', 'srv')
+  with pytest.raises(mergeconf.exceptions.InvalidConfiguration) as e:
+    paths.merge()
+  assert len(e.value.violations) == 2
+  assert 'srv/logs' in e.value.violations[0]
+
+def test_formatted_values():
+  """
+  Tests references to items of other types are replaced by their values
+  formatted as in configuration files.
+  """
+  conf = mergeconf.MergeConf('test', interpolate=True)
+  conf.add('ports', type=typing.List[int], value='80,443')
+  conf.add('secure', type=bool, value=True)
+  conf.add('summary', value='ports ${ports} secure ${secure}')
+  conf.merge()
+  assert conf.summary == 'ports 80, 443 secure true'
@@ -0,0 +1,50 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint:
+import os
+import subprocess
+import sys
+
+# import time budget in milliseconds for `import mergeconf`, taking the best
+# of several runs to reduce noise.  The default is several times the usual
+# import time, so that it is only exceeded by real regressions even on a slow
+# or busy machine.
+import_budget = float(os.environ.get('MERGECONF_IMPORT_BUDGET_MS', 100))
+import_runs = 5
+
+def python(*args):
+  return subprocess.run([sys.executable, *args], stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    cwd=os.path.dirname(os.path.dirname(__file__)))
+
+def test_import_footprint():
+  """
+  Tests that importing the package does not import modules only needed on
+  some code paths.
+  """
+  result = python('-c', 'import sys, mergeconf; print(" ".join(sys.modules))')
+  imported = set(result.stdout.split())
+  assert 'mergeconf' in imported
+  lazy = {
+    'argparse', 'configparser', 'hashlib', 'http.client', 'json', 'logging',
+    'mmap', 'multiprocessing', 're', 'sqlite3', 'mergeconf.mergeconfbatch',
+    'mergeconf.mergeconfhttp', 'mergeconf.mergeconfindex',
+    'mergeconf.mergeconfinterpolator', 'mergeconf.mergeconfsqlite',
+    'mergeconf.mergeconfvalidator', 'mergeconf.mergeconfwriter', 'tempfile',
+  }
+  assert not lazy & imported
+
+def test_import_time():
+  """
+  Tests the cumulative time to import the package, as reported by
+  `python -X importtime`, is within budget.
+  """
+  timings = []
+  for _ in range(import_runs):
+    result = python('-X', 'importtime', '-c', 'import mergeconf')
+    for line in result.stderr.splitlines():
+      fields = [x.strip() for x in line.split('|')]
+      if len(fields) == 3 and fields[2] == 'mergeconf':
+        timings.append(int(fields[1]) / 1000)
+  best = min(timings)
+  print(f"import mergeconf: {best:.1f} ms (budget {import_budget} ms)")
+  assert best < import_budget
@@ -0,0 +1,88 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name,protected-access,unused-import
+import pytest
+from tests.fixtures import config, argparser
+import mergeconf
+
+# the same definition as the `config` fixture
+schema = {
+  'name': { 'description': "Unique name for the thing" },
+  'shape': { 'mandatory': True, 'cli': True,
+    'description': "The shape of the thing" },
+  'colour': { 'value': 'black', 'cli': True,
+    'description': "The colour of the thing" },
+  'upsidedown': { 'type': bool, 'cli': True,
+    'description': "Upside-downness of the thing" },
+  'rightsideup': { 'type': bool, 'value': True, 'cli': True,
+    'description': "Is this thing right-side-up" },
+  'section1': {
+    'fluff': { 'type': str, 'value': 'light', 'cli': True,
+      'description': "What level of fluffiness does this item exhibit" },
+    'density': { 'type': int,
+      'description': "It's hard to come up with examples" },
+  },
+  'section2': {
+    'count': { 'type': int, 'mandatory': True, 'cli': True,
+      'description': "How many of the thing" },
+    'ratio': { 'type': float, 'cli': True,
+      'description': "The ratio of thing to thang" },
+  },
+}
+
+def test_from_schema(config, argparser):
+  """
+  Tests a configuration defined from a schema is the same as one defined
+  item by item.
+  """
+  conf = mergeconf.MergeConf.from_schema('test', schema,
+    files='tests/test1.conf')
+  assert conf.sample_config() == config.sample_config()
+
+  conf.config_argparser(argparser)
+  args = argparser.parse_args(['--shape=round', '--section2-count=3'])
+  conf.merge(args)
+  config.merge(args)
+  assert conf.to_dict() == config.to_dict()
+  assert conf.fingerprint() == config.fingerprint()
+
+def test_add_many_tuples():
+  """
+  Tests items may be given by fully qualified name, in shorthand, and are
+  added to existing sections.
+  """
+  conf = mergeconf.MergeConf('test')
+  db = conf.add_section('db')
+  db.add('host', value='localhost')
+  conf.add_many([
+    ('name', None),
+    ('db.port', int),
+    ('db.host', { 'mandatory': True }),
+    ('db.pool.size', 8),
+  ])
+  assert conf.add_section('db') is db
+  assert conf.db.port is None
+  assert conf.db._items['port'].type == int
+  assert conf.db.host == 'localhost'
+  assert conf.db._items['host'].mandatory
+  assert conf.db.pool.size == 8
+  assert conf.db.pool._parent is db
+
+  # the schema is rebuilt to include the new items
+  conf.merge()
+  assert conf.fingerprint() == mergeconf.MergeConf.from_schema('test', {
+    'name': None,
+    'db': { 'host': 'localhost', 'port': int, 'pool': { 'size': 8 } },
+  }).fingerprint()
+
+def test_add_many_invalid():
+  """
+  Tests an invalid specification is rejected without changing the
+  configuration.
+  """
+  conf = mergeconf.MergeConf('test')
+  with pytest.raises(mergeconf.exceptions.UnsupportedType):
+    conf.add_many({ 'a': int, 'b': { 'c': { 'type': list } } })
+  with pytest.raises(TypeError):
+    conf.add_many([('a', int), ('b.c', { 'type': int, 'colour': 'red' })])
+  assert not conf._items
+  assert not conf._sections
@@ -0,0 +1,107 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=unused-import,redefined-outer-name
+import io
+import json
+import pytest
+from tests.fixtures import config, config_not_strict, config_strict
+import mergeconf
+
+def test_dump_json_nested(config):
+  """
+  Tests the merged configuration is written as nested JSON.
+  """
+  config.merge()
+  out = io.StringIO()
+  config.dump_json(out)
+  assert json.loads(out.getvalue()) == config.to_dict()
+
+def test_dump_json_flat(config):
+  """
+  Tests the merged configuration is written as flat JSON with dotted keys.
+  """
+  config.merge()
+  out = io.StringIO()
+  config.dump_json(out, flat=True)
+  d = json.loads(out.getvalue())
+  assert d['shape'] == 'circle'
+  assert d['section2.count'] == 4
+  assert d['section1.fluff'] == 'light'
+  assert 'section2' not in d
+
+@pytest.mark.parametrize('flat', [False, True])
+def test_json_round_trip(config, flat):
+  """
+  Tests JSON written by one configuration can be loaded into another with the
+  same definition, with values keeping their native types.
+  """
+  config.merge()
+  out = io.StringIO()
+  config.dump_json(out, flat=flat)
+
+  conf = mergeconf.MergeConf('test')
+  conf.add('name')
+  conf.add('shape', mandatory=True)
+  conf.add('colour', value='black')
+  conf.add('upsidedown', type=bool)
+  conf.add('rightsideup', type=bool, value=True)
+  conf.add_section('section1').add('fluff')
+  conf.section1.add('density', type=int)
+  conf.add_section('section2').add('count', type=int, mandatory=True)
+  conf.section2.add('ratio', type=float)
+  conf.load_json(io.StringIO(out.getvalue()))
+  assert conf.to_dict() == config.to_dict()
+  assert conf.section2.count == 4
+  assert conf.upsidedown is False
+
+def test_load_json_coerces_strings(config_strict):
+  """
+  Tests values given as strings in JSON are converted as from other sources.
+  """
+  config_strict.load_json(io.StringIO(
+    '{"shape": "oval", "upsidedown": "yes", "section2": {"count": "7"}}'
+  ))
+  assert config_strict.upsidedown is True
+  assert config_strict.section2.count == 7
+
+def test_load_json_missing_mandatory(config):
+  """
+  Tests mandatory items are checked while loading.
+  """
+  with pytest.raises(mergeconf.exceptions.MissingConfiguration) as e:
+    config.load_json(io.StringIO('{"section2.ratio": 1.5}'))
+  assert e.value.missing == "shape, section2.count"
+  assert config.section2.ratio == 1.5
+
+def test_load_json_strict(config_strict):
+  """
+  Tests unexpected items and sections are rejected when strict.
+  """
+  with pytest.raises(mergeconf.exceptions.UndefinedConfiguration) as e:
+    config_strict.load_json(io.StringIO('{"section2": {"snurf": 1}}'))
+  assert e.value.section == 'section2'
+  assert e.value.item == 'snurf'
+  with pytest.raises(mergeconf.exceptions.UndefinedSection) as e:
+    config_strict.load_json(io.StringIO('{"section3": {"blarb": 32}}'))
+  assert e.value.section == 'section3'
+
+def test_load_json_mismatched(config_not_strict):
+  """
+  Tests sections given as items, and items given as sections, are rejected
+  whether or not strict.
+  """
+  with pytest.raises(mergeconf.exceptions.UndefinedConfiguration) as e:
+    config_not_strict.load_json(io.StringIO('{"section2": "count"}'))
+  assert e.value.item == 'section2'
+  with pytest.raises(mergeconf.exceptions.UndefinedSection) as e:
+    config_not_strict.load_json(io.StringIO('{"shape": {"sides": 4}}'))
+  assert e.value.section == 'shape'
+
+def test_load_json_not_strict(config_not_strict):
+  """
+  Tests unexpected items and sections are added when not strict.
+  """
+  config_not_strict.load_json(io.StringIO(
+    '{"shape": "oval", "section2": {"snurf": "garbage"}, "section3.blarb": 32}'
+  ))
+  assert config_not_strict.section2.snurf == 'garbage'
+  assert config_not_strict.section3.blarb == 32
@@ -0,0 +1,524 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name,protected-access,unused-import
+import io
+import os
+import sqlite3
+import typing
+import pytest
+from tests.fixtures import argparser
+import mergeconf
+from mergeconf.mergeconfindex import MergeConfIndex
+
+@pytest.fixture
+def partitions(tmp_path, monkeypatch):
+  """
+  Create a configuration with a section per partition, each backed by its
+  own file.
+  """
+  monkeypatch.chdir(tmp_path)
+  with open('main.conf', 'w') as f:
+    f.write("name = cluster\n")
+  for i in range(3):
+    with open(f"part{i}.conf", 'w') as f:
+      f.write(f"nodes = {i * 10}\n[part{i}]\nqueue = q{i}\n")
+  conf = mergeconf.MergeConf('test', files='main.conf')
+  conf.add('name')
+  for i in range(3):
+    part = conf.add_section(f"part{i}", file=f"part{i}.conf")
+    part.add('nodes', type=int, mandatory=True)
+    part.add('queue', cli=True)
+  return conf
+
+def test_lazy_section(partitions):
+  """
+  Tests lazy sections are only loaded when accessed.
+  """
+  partitions.merge()
+  assert not any(partitions._sections[f"part{i}"]._loaded for i in range(3))
+  assert partitions.part1.nodes == 10
+  assert partitions['part1']['queue'] == 'q1'
+  assert partitions._sections['part1']._loaded
+  assert not partitions._sections['part0']._loaded
+  assert not partitions._sections['part2']._loaded
+
+def test_lazy_section_precedence(partitions, argparser, monkeypatch):
+  """
+  Tests the environment and command-line arguments override lazily loaded
+  values.
+  """
+  monkeypatch.setenv('TEST_PART0_NODES', '99')
+  partitions.config_argparser(argparser)
+  partitions.merge(argparser.parse_args(['--part2-queue=fast']))
+  assert partitions.part0.nodes == 99
+  assert partitions.part2.queue == 'fast'
+  assert partitions.part2.nodes == 20
+
+def test_lazy_section_whole_configuration(partitions):
+  """
+  Tests operations on the whole configuration load every section.
+  """
+  partitions.merge()
+  assert partitions.to_dict()['part2'] == {'nodes': 20, 'queue': 'q2'}
+  assert partitions.snapshot().part0.queue == 'q0'
+
+def test_lazy_section_snapshot(partitions):
+  """
+  Tests snapshots only load lazy sections when they are accessed, and that
+  redefining an existing section leaves the definition as it was.
+  """
+  partitions.merge()
+  snapshot = partitions.snapshot()
+  assert not partitions._sections['part0']._loaded
+  assert snapshot.part0.nodes == 0
+  assert partitions._sections['part0']._loaded
+  assert not partitions._sections['part1']._loaded
+
+  revision = partitions._revision
+  assert partitions.add_section('part0') is partitions._sections['part0']
+  partitions.add_section('part1', file='part1.conf')
+  assert partitions._revision == revision
+  assert not partitions._sections['part1']._loaded
+
+def test_lazy_section_validated_on_load(partitions):
+  """
+  Tests mandatory items in lazy sections are checked when loaded.
+  """
+  with open('part1.conf', 'w') as f:
+    f.write("queue = q1\n")
+  partitions.merge()
+  with pytest.raises(mergeconf.exceptions.MissingConfiguration) as e:
+    print(partitions.part1.queue)
+  assert e.value.missing == 'part1.nodes'
+
+  # still reported on later accesses, until the file is fixed
+  with pytest.raises(mergeconf.exceptions.MissingConfiguration):
+    print(partitions.part1.queue)
+  with open('part1.conf', 'a') as f:
+    f.write("nodes = 10\n")
+  assert partitions.part1.nodes == 10
+
+def test_lazy_section_merged_into(partitions):
+  """
+  Tests values merged into a lazy section before it is loaded are not
+  overwritten by its file, which need not be complete on its own.
+  """
+  with open('main.conf', 'w') as f:
+    f.write("[part1]\nnodes = 5\n")
+  with open('part1.conf', 'w') as f:
+    f.write("queue = q1\n")
+  partitions.merge()
+  assert partitions.part1.nodes == 5
+  assert partitions.part1.queue == 'q1'
+
+  partitions.load_json(io.StringIO('{"part2.queue": "json"}'))
+  assert partitions.part2.queue == 'json'
+  assert partitions.part2.nodes == 20
+
+  with sqlite3.connect('overrides.db') as db:
+    db.execute("CREATE TABLE mergeconf (scope, section, key, value)")
+    db.execute("INSERT INTO mergeconf VALUES ('node', 'part0', 'queue', 'db')")
+  db.close()
+  partitions.merge_sqlite('overrides.db', 'node')
+  assert partitions.part0.queue == 'db'
+  assert partitions.part0.nodes == 0
+
+def test_lazy_section_whole_configuration(partitions):
+  """
+  Tests operations on the whole configuration load lazy sections rather than
+  treating them as holding default values.
+  """
+  partitions.merge()
+  other = partitions._clone()
+  other.set('part2.nodes', 99)
+  assert partitions.diff(other).changed == {'part2.nodes': (20, 99)}
+  assert all(partitions._sections[f"part{i}"]._loaded for i in range(3))
+
+  # redefined to be loaded again
+  partitions.add_section('part1', file='part1.conf', index=True)
+  buffer = io.StringIO()
+  partitions.dump_json(buffer, flat=True)
+  assert '"part1.queue": "q1"' in buffer.getvalue()
+
+  # dependencies in sections not yet loaded
+  partitions.add_section('part2', file='part2.conf', index=True)
+  partitions.add('total', check=lambda value, nodes: nodes == 20,
+    depends=['part2.nodes'])
+  partitions.validate()
+  assert partitions._sections['part2']._loaded
+
+def test_lazy_section_reload(partitions):
+  """
+  Tests lazy sections already loaded are loaded again on reload, and those
+  loaded only to merge the configuration are then loaded in place.
+  """
+  partitions.merge()
+  assert partitions.part1.nodes == 10
+  with open('part1.conf', 'w') as f:
+    f.write("nodes = 11\n")
+  with open('main.conf', 'w') as f:
+    f.write("[part2]\nqueue = main2\n")
+  partitions.reload()
+  assert partitions.snapshot().part1.nodes == 11
+  assert partitions.part1.nodes == 11
+  assert partitions._sections['part2']._loaded
+  assert partitions.part2.nodes == 20
+  assert partitions.part2.queue == 'main2'
+  assert not partitions._sections['part0']._loaded
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+  """
+  Create a configuration file with many sections.
+  """
+  monkeypatch.chdir(tmp_path)
+  with open('big.conf', 'w') as f:
+    f.write("# cluster\nname = big\n\n")
+    for i in range(1000):
+      f.write(f"[node{i}]\nrack = r{i // 40}\nslots = {i % 64}\n\n")
+  return 'big.conf'
+
+def test_index(sharded):
+  """
+  Tests the index finds every section and reads each in isolation.
+  """
+  index = MergeConfIndex.for_file(sharded)
+  assert len(index.sections) == 1000
+  assert index.read(['node5']) == "[node5]\nrack = r0\nslots = 5\n\n"
+  assert index.read([None]) == "# cluster\nname = big\n\n"
+  assert index.read(['node999', 'node1']) == \
+    "[node1]\nrack = r0\nslots = 1\n\n[node999]\nrack = r24\nslots = 39\n\n"
+  assert MergeConfIndex.for_file(sharded) is index
+
+def test_index_rebuilt(sharded):
+  """
+  Tests the index is rebuilt when the file changes, and may be kept in a
+  file.
+  """
+  index = MergeConfIndex.for_file(sharded, persist=True)
+  assert os.path.exists('big.conf.idx')
+  with open(sharded, 'a') as f:
+    f.write("[extra]\nrack = r99\n")
+  index = MergeConfIndex.for_file(sharded, persist=True)
+  assert index.read(['extra']) == "[extra]\nrack = r99\n"
+
+  # a new process would use the persisted index
+  mergeconf.mergeconfindex._indexes.clear()
+  with open('big.conf.idx') as f:
+    assert 'extra' in f.read()
+  assert MergeConfIndex.for_file(sharded, persist=True).read(['node0']) == \
+    "[node0]\nrack = r0\nslots = 0\n\n"
+
+def test_merge_file_sections(sharded):
+  """
+  Tests only the requested sections of a file are merged.
+  """
+  conf = mergeconf.MergeConf('test', strict=False)
+  conf.merge_file(sharded, sections=[None, 'node42'])
+  assert conf.name == 'big'
+  assert conf.node42.slots == '42'
+  assert list(conf.sections) == ['node42']
+
+def test_lazy_section_indexed(sharded):
+  """
+  Tests lazy sections can be loaded from their region of a shared file.
+  """
+  conf = mergeconf.MergeConf('test')
+  conf.add('name')
+  for i in range(1000):
+    node = conf.add_section(f"node{i}", file=sharded, index=True)
+    node.add('rack')
+    node.add('slots', type=int)
+  conf.merge()
+  assert conf.name is None
+  assert conf.node77.slots == 13
+  assert conf['node999'].rack == 'r24'
+
+@pytest.fixture
+def overrides(tmp_path, monkeypatch):
+  """
+  Create a database of per-node and per-allocation overrides.
+  """
+  monkeypatch.chdir(tmp_path)
+  with sqlite3.connect('overrides.db') as db:
+    db.execute("CREATE TABLE mergeconf (scope, section, key, value)")
+    db.executemany("INSERT INTO mergeconf VALUES (?, ?, ?, ?)", [
+      ('default', None, 'name', 'cluster'),
+      ('default', 'limits', 'slots', '8'),
+      ('node7', 'limits', 'slots', '16'),
+      ('node7', 'limits.memory', 'GB', 64),
+      ('alloc1', '', 'name', 'alloc'),
+      ('node8', 'limits', 'slots', '32'),
+      ('typed', None, 'exclusive', 1),
+      ('typed', 'limits', 'slots', 4.0),
+      ('typed', 'limits', 'cores', 12),
+      ('typed', 'limits', 'hosts', 5),
+    ])
+  db.close()
+  conf = mergeconf.MergeConf('test')
+  conf.add('name')
+  limits = conf.add_section('limits')
+  conf.add('exclusive', type=bool)
+  limits.add('slots', type=int)
+  limits.add('cores', type=typing.List[int])
+  limits.add('hosts', type=mergeconf.MergeConfHostlist)
+  limits.add_section('memory').add('gb', type=int)
+  return conf
+
+def test_sqlite(overrides):
+  """
+  Tests rows for the given scopes are merged in order.
+  """
+  overrides.merge_sqlite('overrides.db', ['default', 'node7', 'alloc1'])
+  assert overrides.name == 'alloc'
+  assert overrides.limits.slots == 16
+  assert overrides.limits.memory.gb == 64
+
+  conf = mergeconf.MergeConf('test', strict=False)
+  conf.merge_sqlite('overrides.db', 'node7')
+  assert conf.limits.slots == '16'
+  assert conf.limits.memory.gb == 64
+  with pytest.raises(mergeconf.exceptions.UndefinedSection):
+    mergeconf.MergeConf('test').merge_sqlite('overrides.db', 'node7')
+
+def test_sqlite_typed(overrides):
+  """
+  Tests values stored as numbers rather than text are converted to the
+  items' types.
+  """
+  overrides.merge_sqlite('overrides.db', 'typed')
+  assert overrides.exclusive is True
+  assert overrides.limits.slots == 4
+  assert overrides.limits.cores.tolist() == [12]
+  assert list(overrides.limits.hosts) == ['5']
+
+def test_sqlite_cached(overrides, monkeypatch):
+  """
+  Tests the database is only queried again once it changes.
+  """
+  from mergeconf import mergeconfsqlite
+  queries = []
+  connect = sqlite3.connect
+  monkeypatch.setattr(mergeconfsqlite.sqlite3, 'connect',
+    lambda *args, **kwargs: queries.append(args) or connect(*args, **kwargs))
+  overrides.merge_sqlite('overrides.db', ['default', 'node8'])
+  overrides.merge_sqlite('overrides.db', ['default', 'node8'])
+  assert len(queries) == 1
+  assert overrides.limits.slots == 32
+
+  with connect('overrides.db') as db:
+    db.execute("UPDATE mergeconf SET value = '24' WHERE scope = 'node8'")
+  db.close()
+  overrides.merge_sqlite('overrides.db', ['default', 'node8'])
+  assert len(queries) == 2
+  assert overrides.limits.slots == 24
+
+@pytest.fixture
+def server():
+  """
+  Serve a configuration file over HTTP with ETags, recording each request's
+  client address and status.
+  """
+  import http.server
+  import socketserver
+  import threading
+
+  class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    content = "name = served\n[part0]\nqueue = q0\n"
+    requests = []
+
+    def do_GET(self):
+      etag = f'"{hash(self.content)}"'
+      # recorded before responding, as the client may check straight after
+      if self.headers.get('If-None-Match') == etag:
+        Handler.requests.append((self.client_address, 304))
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return
+      Handler.requests.append((self.client_address, 200))
+      body = self.content.encode()
+      self.send_response(200)
+      self.send_header('ETag', etag)
+      self.send_header('Content-Type', 'text/plain; charset=utf-8')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, *args):
+      pass
+
+  class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+  httpd = Server(('127.0.0.1', 0), Handler)
+  thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+  thread.start()
+  yield (f"http://127.0.0.1:{httpd.server_address[1]}/app.conf", Handler)
+  httpd.shutdown()
+  httpd.server_close()
+  mergeconf.mergeconfhttp._responses.clear()
+  mergeconf.mergeconfhttp._pool.clear()
+
+def test_http(server, monkeypatch):
+  """
+  Tests configuration files may be served over HTTP, and are revalidated
+  over the same connection rather than fetched again.
+  """
+  url, handler = server
+  conf = mergeconf.MergeConf('test', files=url)
+  conf.add('name')
+  conf.add_section('part0').add('queue')
+  conf.merge()
+  assert conf.name == 'served'
+  assert conf.part0.queue == 'q0'
+
+  conf.merge()
+  monkeypatch.setenv('TEST_CONFIG', url)
+  mergeconf.MergeConf('test', strict=False).merge()
+  assert [status for _, status in handler.requests] == [200, 304, 304]
+  assert len({address for address, _ in handler.requests}) == 1
+
+  handler.content = "name = changed\n"
+  conf.merge()
+  assert conf.name == 'changed'
+  assert handler.requests[-1][1] == 200
+
+def test_http_shared_cache(server, tmp_path, monkeypatch):
+  """
+  Tests served files may be cached for other processes, and that files
+  which cannot be fetched are reported as missing.
+  """
+  url, handler = server
+  monkeypatch.setenv('MERGECONF_HTTP_CACHE', str(tmp_path / 'cache'))
+  conf = mergeconf.MergeConf('test', strict=False)
+  conf.merge_file(url, sections=[None])
+  assert conf.name == 'served'
+  assert 'part0' not in conf.sections
+
+  # as if in another process
+  mergeconf.mergeconfhttp._responses.clear()
+  conf.merge_file(url)
+  assert [status for _, status in handler.requests] == [200, 304]
+  cached = os.listdir(tmp_path / 'cache')
+  assert len(cached) == 1 and cached[0].endswith('.json')
+
+  with pytest.raises(mergeconf.exceptions.MissingConfigurationFile):
+    conf.merge_file('http://127.0.0.1:1/app.conf')
+
+@pytest.fixture
+def saved(tmp_path):
+  """
+  Create a configuration file with comments, and a configuration merged from
+  it.
+  """
+  path = tmp_path / 'app.conf'
+  path.write_text(
+    "# the name\n"
+    "name = old\n"
+    "colour = red\n"
+    "\n"
+    "[db]\n"
+    "; connection\n"
+    "Port = 5432\n"
+    "hosts = a\n"
+    "  b\n"
+    "user = admin\n"
+    "\n"
+    "[log]\n"
+    "level = info\n"
+    "format = line one\n"
+    "  line two\n")
+  conf = mergeconf.MergeConf('test', files=str(path))
+  conf.add('name')
+  conf.add('colour')
+  conf.add('shape')
+  db = conf.add_section('db')
+  db.add('port', type=int)
+  db.add('hosts')
+  db.add('user')
+  db.add('timeout', type=float)
+  log = conf.add_section('log')
+  log.add('level')
+  log.add('format')
+  conf.add_section('cache').add('size', type=int)
+  conf.merge()
+  return (conf, path)
+
+def test_save(saved):
+  """
+  Tests only items set since the last save are written, with the rest of
+  the file left as it was.
+  """
+  conf, path = saved
+  conf.set('name', 'new')
+  conf.set('db.port', 6543)
+  conf.set('db.hosts', 'c')
+  conf.set('db.timeout', '2.5')
+  conf.set('shape', 'round')
+  conf.set('cache.size', 10)
+  conf.set('colour', None)
+  conf.set('log.format', None)
+  conf.save(str(path))
+  assert path.read_text() == (
+    "# the name\n"
+    "name = new\n"
+    "#colour = red\n"
+    "shape = round\n"
+    "\n"
+    "[db]\n"
+    "; connection\n"
+    "Port = 6543\n"
+    "hosts = c\n"
+    "user = admin\n"
+    "timeout = 2.5\n"
+    "\n"
+    "[log]\n"
+    "level = info\n"
+    "#format = line one\n"
+    "#  line two\n"
+    "\n"
+    "[cache]\n"
+    "size = 10\n")
+
+  reread = mergeconf.MergeConf('test', files=str(path), strict=False)
+  reread.merge()
+  assert reread.name == 'new'
+  assert reread.db.port == '6543'
+  assert reread.cache.size == '10'
+  assert reread.log.level == 'info'
+
+  # nothing set since, so nothing changes
+  before = os.stat(path)
+  conf.save(str(path))
+  assert "shape = round\n" in path.read_text()
+  assert os.stat(path).st_ino != before.st_ino
+  assert not [x for x in os.listdir(path.parent) if x.startswith('.')]
+
+def test_save_new_file(saved, tmp_path):
+  """
+  Tests saving to a file which does not exist, and items which cannot be
+  set or saved.
+  """
+  conf, _ = saved
+  with pytest.raises(mergeconf.exceptions.UndefinedConfiguration):
+    conf.set('db.missing', 1)
+  with pytest.raises(mergeconf.exceptions.UndefinedSection):
+    conf.set('missing.port', 1)
+
+  conf.set('log.level', 'debug')
+  conf.set('name', 'x')
+  path = tmp_path / 'new.conf'
+  mask = os.umask(0o027)
+  try:
+    conf.save(str(path))
+  finally:
+    os.umask(mask)
+  assert path.read_text() == "name = x\n\n[log]\nlevel = debug\n"
+  assert os.stat(path).st_mode & 0o777 == 0o640
+
+  conf.db.add_section('replica').add('port')
+  conf.set('db.replica.port', '1')
+  with pytest.raises(ValueError):
+    conf.save(str(path))
@@ -0,0 +1,266 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name,protected-access
+import pytest
+from tests.fixtures import config, argparser
+import mergeconf
+
+def build(sections=10, items=10):
+  """
+  Build a configuration with the given number of sections and items per
+  section.
+  """
+  conf = mergeconf.MergeConf('test', strict=False)
+  conf.add('name', value='base')
+  for i in range(sections):
+    section = conf.add_section(f"s{i}")
+    for j in range(items):
+      section.add(f"i{j}", value=j)
+  return conf
+
+@pytest.fixture
+def pair():
+  return (build(), build())
+
+def test_diff_identical(pair):
+  """
+  Tests identical configurations have no differences.
+  """
+  a, b = pair
+  assert a.diff(b) == ({}, {}, {})
+
+def test_diff(pair, tmp_path):
+  """
+  Tests added, removed and changed items are all found.
+  """
+  a, b = pair
+  conffile = tmp_path / 'test.conf'
+  conffile.write_text("name = other\n[s3]\ni4 = 40\nnew = 1\n[extra]\nx = y\n")
+  b.merge_file(str(conffile))
+  a.s5.add('gone', value='yes')
+
+  diff = a.diff(b)
+  assert diff.changed == {'name': ('base', 'other'), 's3.i4': (4, 40)}
+  assert diff.added == {'s3.new': '1', 'extra.x': 'y'}
+  assert diff.removed == {'s5.gone': 'yes'}
+
+def test_diff_skips_unchanged_sections(pair):
+  """
+  Tests that after a change only the digests on the path to the changed item
+  are recalculated.
+  """
+  a, b = pair
+  a.diff(b)
+  b.s7._items['i2'].value = 99
+  assert b._digest is None
+  assert b.s7._digest is None
+  assert all(b[f"s{i}"]._digest is not None for i in range(10) if i != 7)
+  assert a.diff(b).changed == {'s7.i2': (2, 99)}
+
+def test_fingerprint_stable():
+  """
+  Tests the fingerprint depends on content and not on definition order.
+  """
+  a = mergeconf.MergeConf('test')
+  a.add('x', value=1)
+  a.add('y', value='two')
+  a.add_section('s').add('z', value=True)
+  b = mergeconf.MergeConf('test')
+  b.add_section('s').add('z', value=True)
+  b.add('y', value='two')
+  b.add('x', value=1)
+  assert a.fingerprint() == b.fingerprint()
+  assert a.fingerprint() == '87f3fd497e99f782078becf1c884997e'
+
+def test_fingerprint_tracks_merges(config, argparser, tmp_path):
+  """
+  Tests the fingerprint follows changes from each source.
+  """
+  config.merge()
+  seen = {config.fingerprint()}
+
+  conffile = tmp_path / 'test.conf'
+  conffile.write_text("[section2]\nratio = 1.5\n")
+  config.merge_file(str(conffile))
+  seen.add(config.fingerprint())
+
+  config._merge_env({'section1_density': '3'})
+  seen.add(config.fingerprint())
+
+  config.config_argparser(argparser)
+  config.merge_args(argparser.parse_args(['--shape=square']))
+  seen.add(config.fingerprint())
+  assert len(seen) == 4
+
+  # changing back restores the original fingerprint
+  fingerprint = config.fingerprint()
+  config.merge_args(argparser.parse_args(['--shape=oval']))
+  assert config.fingerprint() != fingerprint
+  config.merge_args(argparser.parse_args(['--shape=square']))
+  assert config.fingerprint() == fingerprint
+
+def test_subscribe(config, tmp_path):
+  """
+  Tests subscribers are called once per merge with only the changes they are
+  interested in.
+  """
+  calls = {}
+  def subscriber(name):
+    def callback(changes):
+      calls.setdefault(name, []).append(changes)
+    return callback
+
+  config.subscribe('shape', subscriber('shape'))
+  config.subscribe('section2.*', subscriber('section2'))
+  config.subscribe('*', subscriber('all'))
+  config.subscribe('section?.fluff', subscriber('fluff'))
+  config.subscribe('section1.density', subscriber('density'))
+  config.merge()
+  assert calls['shape'] == [{'shape': (None, 'circle')}]
+  assert calls['section2'] == [
+    {'section2.ratio': (None, 20.403), 'section2.count': (None, 4)}
+  ]
+  assert len(calls['all']) == 1
+  assert set(calls['all'][0]) == {
+    'shape', 'upsidedown', 'section2.ratio', 'section2.count'
+  }
+  assert 'fluff' not in calls
+  assert 'density' not in calls
+
+  # values set to what they already are are not changes
+  calls.clear()
+  conffile = tmp_path / 'test.conf'
+  conffile.write_text("shape = circle\n[section1]\nfluff = heavy\n")
+  config.merge_file(str(conffile))
+  assert calls == {
+    'all': [{'section1.fluff': ('light', 'heavy')}],
+    'fluff': [{'section1.fluff': ('light', 'heavy')}],
+  }
+
+def test_subscribe_failed_merge(tmp_path):
+  """
+  Tests changes made by a merge which then fails are reported to subscribers
+  for that merge alone.
+  """
+  conffile = tmp_path / 'test.conf'
+  conffile.write_text("a = 1\n")
+  conf = mergeconf.MergeConf('test', files=str(conffile))
+  conf.add('a')
+  conf.add('b')
+  conf.add('c', mandatory=True)
+  calls = []
+  conf.subscribe('*', calls.append)
+  with pytest.raises(mergeconf.exceptions.MissingConfiguration):
+    conf.merge()
+  assert calls == [{'a': (None, '1')}]
+
+  conf.set('b', '2')
+  assert calls[1:] == [{'b': (None, '2')}]
+
+def test_unsubscribe(config):
+  """
+  Tests unsubscribed callbacks are no longer called.
+  """
+  calls = []
+  config.subscribe('section2.*', calls.append)
+  config.unsubscribe('section2.*', calls.append)
+  config.merge()
+  assert not calls
+
+def test_environment_rescan(config, monkeypatch):
+  """
+  Tests repeated environment merges apply only what is needed while keeping
+  the environment's precedence over files.
+  """
+  monkeypatch.setenv('TEST_SHAPE', 'triangle')
+  monkeypatch.setenv('TEST_SECTION2_COUNT', '15')
+  config.merge()
+  assert config.shape == 'triangle'
+  assert config.section2.count == 15
+
+  # file merged again on repeat merge must still be overridden
+  changes = []
+  config.subscribe('*', changes.append)
+  config.merge()
+  assert config.shape == 'triangle'
+  assert config.section2.count == 15
+  assert not changes
+
+  # nothing reapplied if nothing changed
+  versions = {key: item._version for key, item in config._items.items()}
+  assert config.merge_environment() == {
+    'shape': 'triangle', 'section2_count': '15'
+  }
+  assert versions == {
+    key: item._version for key, item in config._items.items()
+  }
+
+  # only the changed variable is applied
+  monkeypatch.setenv('TEST_SHAPE', 'square')
+  config._items['colour'].value = 'blue'
+  config.merge_environment()
+  assert changes[0]['shape'] == ('triangle', 'square')
+  assert len(changes[0]) == 2
+  assert config.colour == 'blue'
+
+  # new items pick up variables already seen
+  monkeypatch.setenv('TEST_SECTION1_WEIGHT', '3')
+  config.merge_environment()
+  config.section1.add('weight', type=int)
+  config.merge_environment()
+  assert config.section1.weight == 3
+
+def test_environment_shared(monkeypatch):
+  """
+  Tests configurations with different codenames share a scan of the
+  environment, each getting only its own variables.
+  """
+  from mergeconf.mergeconfenv import environment
+  monkeypatch.setenv('SCHED_QUEUE', 'batch')
+  monkeypatch.setenv('DB_HOST', 'db1')
+  monkeypatch.setenv('DB_POOL_SIZE', '4')
+  sched = mergeconf.MergeConf('sched')
+  sched.add('queue')
+  db = mergeconf.MergeConf('db')
+  db.add('host')
+  db.add_section('pool').add('size', type=int)
+  assert sched.merge_environment() == {'queue': 'batch'}
+  assert db.merge_environment() == {'host': 'db1', 'pool_size': '4'}
+
+  # once both are registered, the environment is only scanned on change
+  scans = environment._scans
+  sched.merge_environment()
+  db.merge_environment()
+  assert environment._scans == scans
+  monkeypatch.setenv('DB_HOST', 'db2')
+  sched.merge_environment()
+  db.merge_environment()
+  assert environment._scans == scans + 1
+  assert db.host == 'db2'
+  assert db.pool.size == 4
+  assert sched.queue == 'batch'
+
+def test_to_environ(config, argparser, monkeypatch):
+  """
+  Tests the configuration exported as environment variables is merged into
+  the same configuration, and is only rebuilt once the configuration changes.
+  """
+  config.config_argparser(argparser)
+  config.merge(argparser.parse_args(['--shape=square', '--upsidedown',
+    '--section2-count=4', '--section2-ratio=20.403']))
+  environ = config.to_environ()
+  assert environ['TEST_SHAPE'] == 'square'
+  assert environ['TEST_UPSIDEDOWN'] == 'true'
+  assert environ['TEST_SECTION2_RATIO'] == '20.403'
+  assert 'TEST_NAME' not in environ
+  assert config.to_environ() is environ
+
+  for key, value in environ.items():
+    monkeypatch.setenv(key, value)
+  other = mergeconf.MergeConf('test')
+  config._copy_definition(other)
+  other.merge()
+  assert other.to_dict() == config.to_dict()
+
+  config.merge_args(argparser.parse_args(['--shape=oval']))
+  assert config.to_environ() is not environ
+  assert config.to_environ()['TEST_SHAPE'] == 'oval'
@@ -0,0 +1,154 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name
+import io
+import json
+import sys
+import typing
+import pytest
+from tests.fixtures import argparser
+import mergeconf
+
+@pytest.fixture
+def lists(tmp_path):
+  """
+  Create a configuration with list items, and a file defining them.
+  """
+  conffile = tmp_path / 'lists.conf'
+  conffile.write_text("ports = 8080, 8081,8082\n[weights]\nvalues = 0.5,1.5\n")
+  conf = mergeconf.MergeConf('test', files=str(conffile))
+  conf.add('ports', type=typing.List[int], cli=True, description="Ports to serve")
+  conf.add('nodes', type=typing.List[int], value=[1, 2, 3])
+  weights = conf.add_section('weights')
+  weights.add('values', type=typing.List[float], min=0.0)
+  return conf
+
+def test_list_values(lists):
+  """
+  Tests list values are parsed into read-only views of compact storage.
+  """
+  lists.merge()
+  ports = lists.ports
+  assert isinstance(ports, memoryview)
+  assert ports.readonly
+  assert ports.format == 'q'
+  assert ports.tolist() == [8080, 8081, 8082]
+  assert lists.weights.values.tolist() == [0.5, 1.5]
+  assert list(lists.nodes) == [1, 2, 3]
+  with pytest.raises(TypeError):
+    ports[0] = 80
+
+  # readers share the storage
+  assert lists.ports is ports
+
+def test_list_sources(lists, argparser, monkeypatch):
+  """
+  Tests list values may come from the environment and command line.
+  """
+  monkeypatch.setenv('TEST_WEIGHTS_VALUES', '2.5')
+  monkeypatch.setenv('TEST_NODES', '')
+  lists.config_argparser(argparser)
+  lists.merge(argparser.parse_args(['--ports=22,23']))
+  assert lists.ports.tolist() == [22, 23]
+  assert lists.weights.values.tolist() == [2.5]
+  assert lists.nodes.tolist() == []
+  assert lists.to_environ()['TEST_PORTS'] == '22, 23'
+
+def test_list_formats(lists):
+  """
+  Tests list values are written in samples and JSON and hashed by value.
+  """
+  lists.merge()
+  assert lists.sample_config().startswith(
+    "# (list[int]) Ports to serve\n#ports = 8080, 8081, 8082\n")
+
+  out = io.StringIO()
+  lists.dump_json(out, flat=True)
+  assert json.loads(out.getvalue())['ports'] == [8080, 8081, 8082]
+  out.seek(0)
+  other = mergeconf.MergeConf('test')
+  lists._copy_definition(other)
+  other.load_json(out)
+  assert other.ports.tolist() == [8080, 8081, 8082]
+  assert other.fingerprint() == lists.fingerprint()
+
+def test_list_constraints(lists):
+  """
+  Tests constraints apply to each element of a list.
+  """
+  lists.merge()
+  lists._merge_env({'weights_values': '1.0, -2.0'})
+  with pytest.raises(mergeconf.exceptions.InvalidConfiguration) as e:
+    lists.validate()
+  assert e.value.violations == ['weights.values: -2.0 is less than 0.0']
+
+def test_list_unsupported_type():
+  """
+  Tests lists of types other than numbers are not supported.
+  """
+  conf = mergeconf.MergeConf('test')
+  with pytest.raises(mergeconf.exceptions.UnsupportedType):
+    conf.add('names', type=typing.List[str])
+
+@pytest.mark.skipif(sys.version_info < (3, 9),
+  reason="built-in generic types need Python 3.9")
+def test_list_builtin_generic():
+  """
+  Tests lists may be declared with built-in generic types.
+  """
+  conf = mergeconf.MergeConf('test')
+  conf.add('ports', type=list[int], value='1, 2')
+  assert conf.ports.tolist() == [1, 2]
+
+def test_hostlist():
+  """
+  Tests a host list is worked with in compressed form.
+  """
+  hosts = mergeconf.MergeConfHostlist(
+    'cdr[001-1200,1305], login[1-2],rack[1-2]n[08-10]')
+  assert str(hosts) == 'cdr[001-1200,1305],login[1-2],rack[1-2]n[08-10]'
+  assert len(hosts) == 1209
+  assert hosts[0] == 'cdr001'
+  assert hosts[1200] == 'cdr1305'
+  assert hosts[-1] == 'rack2n10'
+  assert hosts[1201:1205] == ['login1', 'login2', 'rack1n08', 'rack1n09']
+  assert list(hosts)[998:1001] == ['cdr999', 'cdr1000', 'cdr1001']
+  assert list(hosts) == hosts[:]
+  assert 'cdr042' in hosts
+  assert 'cdr42' not in hosts
+  assert 'cdr1201' not in hosts
+  assert 'rack2n09' in hosts
+  assert 'login3' not in hosts
+
+  # digits of adjacent brackets, or of a literal, may be split more than one
+  # way
+  for text in ('n[1-2][1-12]', 'n1[0-9]0[5-6]'):
+    adjacent = mergeconf.MergeConfHostlist(text)
+    assert all(name in adjacent for name in adjacent)
+  assert 'n112' in mergeconf.MergeConfHostlist('n[1-2][1-12]')
+  assert 'n213' not in mergeconf.MergeConfHostlist('n[1-2][1-12]')
+  for invalid in ('cdr[1-', 'cdr]', 'cdr[3-1]', 'cdr[x]', 'cdr[]'):
+    with pytest.raises(ValueError):
+      mergeconf.MergeConfHostlist(invalid)
+
+def test_hostlist_sources(tmp_path, argparser, monkeypatch):
+  """
+  Tests host list items may come from any source.
+  """
+  conffile = tmp_path / 'hosts.conf'
+  conffile.write_text("[batch]\nnodes = cdr[001-1200]\n")
+  conf = mergeconf.MergeConf('test', files=str(conffile))
+  conf.add('login', type=mergeconf.MergeConfHostlist, cli=True)
+  batch = conf.add_section('batch')
+  batch.add('nodes', type=mergeconf.MergeConfHostlist)
+  batch.add('spares', type=mergeconf.MergeConfHostlist)
+  monkeypatch.setenv('TEST_BATCH_SPARES', 'spare[1-4]')
+  conf.config_argparser(argparser)
+  conf.merge(argparser.parse_args(['--login=login[1-2]']))
+
+  assert len(conf.batch.nodes) == 1200
+  assert conf.batch.spares[3] == 'spare4'
+  assert 'login2' in conf.login
+  assert conf.to_environ()['TEST_BATCH_NODES'] == 'cdr[001-1200]'
+  out = io.StringIO()
+  conf.dump_json(out)
+  assert json.loads(out.getvalue())['batch']['nodes'] == 'cdr[001-1200]'
@@ -0,0 +1,119 @@
+# vi: set softtabstop=2 ts=2 sw=2 expandtab:
+# pylint: disable=redefined-outer-name
+import pytest
+import mergeconf
+
+@pytest.fixture
+def constrained():
+  """
+  Create a configuration with constraints on its items.
+  """
+  conf = mergeconf.MergeConf('test')
+  conf.add('shape', value='circle', choices=['circle', 'square'])
+  conf.add('name', pattern=r'[a-z]+[0-9]*')
+  db = conf.add_section('db')
+  db.add('port', value=5432, min=1, max=65535)
+  db.add('min_conns', value=1, min=0)
+  db.add('max_conns', value=10,
+    check=lambda value, lower: value >= lower, depends=['db.min_conns'])
+  return conf
+
+def test_valid(constrained):
+  """
+  Tests a configuration satisfying its constraints validates.
+  """
+  constrained.validate()
+
+def test_all_violations_reported(constrained):
+  """
+  Tests every violation is reported at once.
+  """
+  constrained.add('shape', value='blob', choices=['circle', 'square'])
+  constrained.add('name', value='Fred', pattern=r'[a-z]+[0-9]*')
+  constrained.db.add('port', value=70000, min=1, max=65535)
+  constrained.db.add('min_conns', value=20, min=0)
+  with pytest.raises(mergeconf.exceptions.InvalidConfiguration) as e:
+    constrained.validate()
+  assert e.value.violations == [
+    "shape: blob is not one of circle, square",
+    "name: Fred does not match '[a-z]+[0-9]*'",
+    "db.port: 70000 is greater than 65535",
+    "db.max_conns: 10 failed check",
+  ]
+
+def test_missing_before_invalid(constrained):
+  """
+  Tests missing mandatory items are reported ahead of constraint violations.
+  """
+  constrained.add('colour', mandatory=True)
+  constrained.db.add('port', value=0, min=1)
+  with pytest.raises(mergeconf.exceptions.MissingConfiguration) as e:
+    constrained.validate()
+  assert e.value.missing == 'colour'
+
+def test_undefined_dependency():
+  """
+  Tests a dependency on an undefined item is caught.
+  """
+  conf = mergeconf.MergeConf('test')
+  conf.add('count', value=1, check=lambda value, other: True,
+    depends=['section2.other'])
+  with pytest.raises(mergeconf.exceptions.UndefinedConfiguration) as e:
+    conf.validate()
+  assert e.value.section == 'section2'
+  assert e.value.item == 'other'
+
+def test_revalidation_only_changed(constrained, tmp_path):
+  """
+  Tests that only constraints involving changed items are evaluated again.
+  """
+  calls = []
+  def check(value, lower):
+    calls.append(value)
+    return value >= lower
+  constrained.db.add('max_conns', value=10, check=check,
+    depends=['db.min_conns'])
+  constrained.validate()
+  assert calls == [10]
+
+  # unrelated change
+  conffile = tmp_path / 'test.conf'
+  conffile.write_text("[db]\nport = 6543\n")
+  constrained.merge_file(str(conffile))
+  constrained.validate()
+  assert calls == [10]
+
+  # change to a dependency
+  conffile.write_text("[db]\nmin_conns = 12\n")
+  constrained.merge_file(str(conffile))
+  with pytest.raises(mergeconf.exceptions.InvalidConfiguration) as e:
+    constrained.validate()
+  assert e.value.violations == ["db.max_conns: 10 failed check"]
+  assert calls == [10, 10]
+
+def test_reload_only_changed(constrained, monkeypatch):
+  """
+  Tests a reload checks its values through the configuration's validation
+  plan, so that constraints on unchanged items are not evaluated again.
+  """
+  calls = []
+  def check(value, lower):
+    calls.append(value)
+    return value >= lower
+  constrained.db.add('max_conns', value=10, check=check,
+    depends=['db.min_conns'])
+  constrained.validate()
+  constrained.reload()
+  assert calls == [10]
+
+  monkeypatch.setenv('TEST_DB_MIN_CONNS', '5')
+  constrained.reload()
+  constrained.validate()
+  assert calls == [10, 10]
+
+  # a failed reload leaves the values checked as they were
+  monkeypatch.setenv('TEST_DB_MIN_CONNS', '20')
+  with pytest.raises(mergeconf.exceptions.InvalidConfiguration):
+    constrained.reload()
+  constrained.validate()
+  assert calls == [10, 10, 10, 10]